@@ -0,0 +1,154 @@
+# bench_decoding.py - biaya decode dokumen: object_id_to_str rekursif vs projection + record ber-__slots__
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+
+import records
+from repository import MOOD_SCORES
+
+WORDS = ("sayang", "rindu", "bahagia", "kopi", "hujan", "senja", "kerja", "capek", "jalan", "makan")
+
+RAW_OPTIONS = CodecOptions(document_class=RawBSONDocument, tz_aware=True)
+DICT_OPTIONS = CodecOptions(tz_aware=True)
+
+
+def object_id_to_str(data):
+    """The recursive conversion main.py ran on couple documents before records.py"""
+    if isinstance(data, dict):
+        for k, v in data.items():
+            if isinstance(v, ObjectId):
+                data[k] = str(v)
+            elif isinstance(v, (dict, list)):
+                data[k] = object_id_to_str(v)
+    elif isinstance(data, list):
+        for i, v in enumerate(data):
+            if isinstance(v, ObjectId):
+                data[i] = str(v)
+            elif isinstance(v, (dict, list)):
+                data[i] = object_id_to_str(v)
+    return data
+
+
+def synthetic_docs(kind, count, seed_value):
+    """Documents shaped like the stored ones, including fields the pages never render"""
+    rng = random.Random(seed_value)
+    now = datetime.now(timezone.utc)
+    emojis = list(MOOD_SCORES)
+    for i in range(count):
+        created_at = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+        if kind == "couples":
+            yield {"_id": ObjectId(), "couple_code": f"BENCH{i}", "person1_name": f"Satu{i}",
+                   "person2_name": f"Dua{i}", "created_at": created_at,
+                   "latest_moods": {user: {"mood_emoji": rng.choice(emojis), "mood_note": "",
+                                           "created_at": created_at, "mood_id": ObjectId()}
+                                    for user in ("person1", "person2")}}
+        elif kind == "moods":
+            yield {"_id": ObjectId(), "couple_id": str(ObjectId()), "user_id": "person1",
+                   "mood_emoji": rng.choice(emojis),
+                   "mood_note": " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 12))),
+                   "created_at": created_at, "idempotency_key": str(ObjectId())}
+        else:
+            yield {"_id": ObjectId(), "couple_id": str(ObjectId()),
+                   "quote_text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 20))),
+                   "author": "Unknown", "added_by": "person1", "created_at": created_at,
+                   "idempotency_key": str(ObjectId())}
+
+
+def project(doc, projection):
+    """The document the server would send back for a find() with this projection"""
+    fields = {field for field, include in projection.items() if include}
+    return {k: v for k, v in doc.items() if k in fields or (k == "_id" and projection.get("_id", 1))}
+
+
+def read_fields(doc, fields):
+    # Baca setiap field yang dirender halaman, seperti render_mood_entry / quote_entry_html
+    for field in fields:
+        doc[field]
+
+
+def strategies(record):
+    # Nama field di dokumen; record memetakan "_id" ke atribut id
+    fields = ["_id" if field == "id" else field for field in record.__slots__]
+    return {
+        # Dokumen penuh di-decode ke dict lalu ObjectId diganti string secara rekursif
+        "dict_penuh_rekursif": ("full", lambda data: [
+            read_fields(object_id_to_str(doc), fields)
+            for doc in bson.decode_all(data, DICT_OPTIONS)]),
+        # Yang dipakai sekarang: server hanya mengirim field record, lalu disalin ke record ber-__slots__
+        "projection_record": ("projected", lambda data: [
+            read_fields(doc, fields)
+            for doc in record.from_docs(bson.decode_all(data, DICT_OPTIONS))]),
+        # Decode lazy: setiap akses field mem-parse ulang byte BSON
+        "raw_penuh": ("full", lambda data: [
+            read_fields(doc, fields) for doc in bson.decode_all(data, RAW_OPTIONS)]),
+        "raw_projection": ("projected", lambda data: [
+            read_fields(doc, fields) for doc in bson.decode_all(data, RAW_OPTIONS)]),
+        "raw_tanpa_akses": ("full", lambda data: bson.decode_all(data, RAW_OPTIONS)),
+    }
+
+
+def time_strategy(decode, data, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        decode(data)
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 1)
+
+
+def run(args):
+    results = {}
+    for kind, record in (("couples", records.Couple), ("moods", records.Mood), ("quotes", records.Quote)):
+        docs = list(synthetic_docs(kind, args.docs, args.seed))
+        # Byte BSON seperti yang diterima driver dari server, tanpa dan dengan projection
+        data = {
+            "full": b"".join(bson.encode(doc) for doc in docs),
+            "projected": b"".join(bson.encode(project(doc, record.projection())) for doc in docs),
+        }
+        results[kind] = {
+            "bytes": {shape: len(payload) for shape, payload in data.items()},
+            "ms": {name: time_strategy(decode, data[shape], args.runs)
+                   for name, (shape, decode) in strategies(record).items()},
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark decode dokumen MongoDB ke nilai yang dirender halaman")
+    parser.add_argument("--docs", type=int, default=100000, help="jumlah dokumen per jenis")
+    parser.add_argument("--runs", type=int, default=5, help="jumlah pengukuran per strategi")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="simpan hasil ke file JSON")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    names = list(next(iter(results.values()))["ms"])
+    print(f"{'strategi':<22}" + "".join(f"{kind:>10}" for kind in results) + "  (ms, median)")
+    for name in names:
+        print(f"{name:<22}" + "".join(f"{result['ms'][name]:>10}" for result in results.values()))
+    print(f"\n{'BSON KB':<22}" + "".join(f"{kind:>10}" for kind in results))
+    for shape in ("full", "projected"):
+        print(f"{shape:<22}" + "".join(f"{result['bytes'][shape] // 1024:>10}" for result in results.values()))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# bench_interactions.py - waktu eksekusi script per interaksi: rerun penuh vs rerun fragment saja
+
+import argparse
+import json
+
+# bench_pages memilih backend memory sebelum main.py diimport oleh AppTest
+from bench_pages import bench_login, seed
+
+import database
+import metrics
+
+# Interaksi yang diukur: (halaman, fragment yang dijalankan ulang, aksi pada AppTest).
+# Fragment None berarti interaksi itu tetap menjalankan ulang seluruh script.
+INTERACTIONS = {
+    "pilih_emoji": ("mood_tracker", "mood_input",
+                    lambda at, i: next(b for b in at.button if b.label == ("😊", "😍")[i % 2]).click()),
+    "ketik_catatan": ("mood_tracker", "mood_input",
+                      lambda at, i: at.text_area[0].input(f"catatan ke-{i}")),
+    "ganti_grafik": ("mood_tracker", "mood_chart",
+                     lambda at, i: at.selectbox(key="mood_chart_granularity").set_value(("Harian", "Mingguan")[i % 2])),
+    "halaman_mood": ("mood_tracker", "mood_notes",
+                     lambda at, i: next(b for b in at.button if b.label in ("Lebih lama ➡️", "⬅️ Lebih baru")).click()),
+    "halaman_quote": ("quotes", "quote_list",
+                      lambda at, i: next(b for b in at.button if b.label in ("Lebih lama ➡️", "⬅️ Lebih baru")).click()),
+    "test_koneksi": ("dashboard", "sidebar_status",
+                     lambda at, i: next(b for b in at.button if b.label == "🔄 Test Koneksi").click()),
+    "ganti_tema": ("dashboard", None,
+                   lambda at, i: at.button(key="theme_toggle_sidebar").click()),
+}
+
+
+def measure(at, page, fragment, action, runs):
+    """Median script time of the full rerun and of the fragment inside it, over `runs` interactions
+
+    AppTest always reruns the whole script, so the fragment's time inside that rerun stands
+    in for a fragment-only rerun in the browser.
+    """
+    at.session_state["current_page"] = page
+    at.run()
+    metrics.performance.clear()
+    for i in range(runs):
+        action(at, i)
+        at.run()
+        if at.exception:
+            raise RuntimeError(f"AppTest exception: {at.exception[0].value}")
+    stats = metrics.performance.page_stats()[page]
+    return {
+        "full_rerun_ms": stats["render_p50_ms"],
+        "fragment_ms": stats["fragment_p50_ms"].get(fragment) if fragment else None,
+    }
+
+
+def run(args):
+    db = database.get_database(None, backend="memory")
+    login_name = seed(db, args.couples, args.moods, args.quotes, args.days, args.seed)
+    at, _ = bench_login(login_name, args.timeout)
+    return {name: dict(zip(("page", "fragment"), (page, fragment)), **measure(at, page, fragment, action, args.runs))
+            for name, (page, fragment, action) in INTERACTIONS.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark waktu script per interaksi (rerun penuh vs fragment)")
+    parser.add_argument("--couples", type=int, default=100)
+    parser.add_argument("--moods", type=int, default=10000)
+    parser.add_argument("--quotes", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=365, help="rentang waktu data sintetis")
+    parser.add_argument("--runs", type=int, default=10, help="jumlah interaksi yang diukur per jenis")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=600, help="batas waktu satu rerun AppTest (detik)")
+    parser.add_argument("--json", help="simpan hasil ke file JSON")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    print(f"{'interaksi':<16}{'fragment':<18}{'sebelum':>10}{'sesudah':>10}{'hemat':>8}  (ms, median)")
+    for name, result in results.items():
+        before = result["full_rerun_ms"]
+        after = result["fragment_ms"] if result["fragment"] else before
+        saved = f"{1 - after / before:.0%}" if before else "-"
+        print(f"{name:<16}{result['fragment'] or '(penuh)':<18}{before:>10}{after:>10}{saved:>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
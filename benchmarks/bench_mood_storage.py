@@ -0,0 +1,174 @@
+# bench_mood_storage.py - bandingkan penyimpanan mood "flat" dan "bucket": ukuran data/index dan latensi query
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bson
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+
+import database
+import migrations
+import repository
+from metrics import percentile
+from repository import MOOD_SCORES
+
+INSERT_BATCH_SIZE = 5000
+# Database sementara saat benchmark dijalankan terhadap MongoDB sungguhan (--uri)
+BENCH_DATABASE = f"{database.DATABASE_NAME}_bench"
+
+WORDS = ("sayang", "rindu", "bahagia", "kopi", "hujan", "senja", "kerja", "capek", "jalan", "makan")
+
+# Query yang diukur, dengan pemanggilan yang sama seperti halaman mood tracker
+QUERIES = {
+    "count": lambda moods, couple_id, today: moods.count(couple_id, "person1"),
+    "history_page": lambda moods, couple_id, today: moods.page(couple_id, "person1", limit=5),
+    "timeseries_90d": lambda moods, couple_id, today: moods.timeseries(
+        couple_id, "person1", "day", today - timedelta(days=89), today),
+    "couple_timeline_90d": lambda moods, couple_id, today: moods.couple_timeline(
+        couple_id, "week", today - timedelta(days=89), today),
+    "search": lambda moods, couple_id, today: moods.search(couple_id, "person1", "kopi senja"),
+}
+
+
+def synthetic_moods(couple_ids, moods, days, seed_value):
+    rng = random.Random(seed_value)
+    now = datetime.now(timezone.utc)
+    emojis = list(MOOD_SCORES)
+    for i in range(moods):
+        yield {
+            "couple_id": str(couple_ids[i % len(couple_ids)]),
+            "user_id": "person1" if (i // len(couple_ids)) % 2 == 0 else "person2",
+            "mood_emoji": rng.choice(emojis),
+            "mood_note": " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 12))),
+            "created_at": now - timedelta(seconds=rng.randint(0, days * 86400)),
+        }
+
+
+def seed(db, repos, couples, moods, days, seed_value):
+    """Create the couples and save the same synthetic moods through the repo's add_many"""
+    couple_ids = [ObjectId() for _ in range(couples)]
+    db.couples.insert_many([{"_id": couple_id, "couple_code": f"BENCH{i}", "person1_name": f"Satu{i}",
+                             "person2_name": f"Dua{i}", "latest_moods": {}} for i, couple_id in enumerate(couple_ids)])
+    batch = []
+    for mood in synthetic_moods(couple_ids, moods, days, seed_value):
+        batch.append(mood)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            repos.moods.add_many(batch)
+            batch = []
+    if batch:
+        repos.moods.add_many(batch)
+    return str(couple_ids[0])
+
+
+def estimated_sizes(collection):
+    """Data and index size computed from the documents, for backends without collStats
+
+    Index size counts one B-tree key per document per index; text indexes are skipped.
+    """
+    indexes = [[field for field, kind in info["key"] if kind in (1, -1)]
+               for name, info in collection.index_information().items()
+               if not any(kind == "text" for _, kind in info["key"])]
+    documents = data_bytes = index_bytes = 0
+    for doc in collection.find():
+        documents += 1
+        data_bytes += len(bson.encode(doc))
+        for fields in indexes:
+            index_bytes += len(bson.encode({field: doc.get(field) for field in fields}))
+    return {"documents": documents, "data_bytes": data_bytes, "index_bytes": index_bytes, "estimated": True}
+
+
+def collection_sizes(db, collection):
+    try:
+        stats = db.command("collStats", collection.name)
+    except (OperationFailure, NotImplementedError, TypeError):
+        return estimated_sizes(collection)
+    return {"documents": stats["count"], "data_bytes": stats["size"], "index_bytes": stats["totalIndexSize"],
+            "estimated": False}
+
+
+def time_queries(moods, couple_id, runs):
+    today = date.today()
+    results = {}
+    for name, query in QUERIES.items():
+        # Panggilan pertama memanaskan cache driver dan index pencarian lokal
+        query(moods, couple_id, today)
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            query(moods, couple_id, today)
+            samples.append((time.perf_counter() - started) * 1000)
+        results[name] = {"median_ms": round(statistics.median(samples), 2),
+                         "p95_ms": round(percentile(samples, 95), 2)}
+    return results
+
+
+def run_mode(args, mood_storage):
+    if args.uri:
+        db = database.get_client(args.uri)[BENCH_DATABASE]
+        backend = "mongodb"
+        for name in ("couples", "moods", repository.BUCKET_COLLECTION, repository.STATS_COLLECTION,
+                     migrations.MIGRATIONS_COLLECTION):
+            db.drop_collection(name)
+    else:
+        # Satu database mongomock baru per mode supaya ukurannya tidak tercampur
+        import mongomock
+        db = mongomock.MongoClient(tz_aware=True)[BENCH_DATABASE]
+        backend = "memory"
+
+    migrations.run_migrations(db)
+    repos = repository.create_repositories(db, backend, mood_storage)
+    started = time.perf_counter()
+    couple_id = seed(db, repos, args.couples, args.moods, args.days, args.seed)
+    seed_seconds = time.perf_counter() - started
+
+    return {
+        "seed_s": round(seed_seconds, 1),
+        "storage": collection_sizes(db, repos.moods.collection),
+        "queries": time_queries(repos.moods, couple_id, args.runs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark penyimpanan mood flat vs bucket")
+    parser.add_argument("--couples", type=int, default=100)
+    parser.add_argument("--moods", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=365, help="rentang waktu data sintetis")
+    parser.add_argument("--runs", type=int, default=20, help="jumlah pengukuran per query")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--uri", help=f"MongoDB sungguhan; database {BENCH_DATABASE} dihapus dan diisi ulang")
+    parser.add_argument("--json", help="simpan hasil ke file JSON")
+    args = parser.parse_args()
+
+    results = {storage: run_mode(args, storage) for storage in repository.MOOD_STORAGES}
+
+    print(f"{'mode':<8}{'dokumen':>10}{'data KB':>12}{'index KB':>12}{'seed s':>9}")
+    for storage, result in results.items():
+        sizes = result["storage"]
+        print(f"{storage:<8}{sizes['documents']:>10}{sizes['data_bytes'] // 1024:>12}"
+              f"{sizes['index_bytes'] // 1024:>12}{result['seed_s']:>9}")
+    if any(result["storage"]["estimated"] for result in results.values()):
+        print("(ukuran dihitung dari BSON dokumen; index teks tidak dihitung)")
+
+    print(f"\n{'query':<22}" + "".join(f"{storage + ' p50':>14}{storage + ' p95':>14}" for storage in results) + "  (ms)")
+    for name in QUERIES:
+        row = "".join(f"{result['queries'][name]['median_ms']:>14}{result['queries'][name]['p95_ms']:>14}"
+                      for result in results.values())
+        print(f"{name:<22}{row}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
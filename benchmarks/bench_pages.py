@@ -0,0 +1,219 @@
+# bench_pages.py - benchmark halaman CeritaKita lewat AppTest dengan data sintetis di backend memory
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+# Backend memory harus dipilih sebelum main.py diimport oleh AppTest
+os.environ["CERITAKITA_BACKEND"] = "memory"
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bson.objectid import ObjectId
+from streamlit.testing.v1 import AppTest
+
+import database
+from cache import read_cache
+from metrics import percentile
+from repository import MOOD_SCORES
+
+BENCH_COUPLE_CODE = "BENCH0"
+PAGES = ("couple_login", "dashboard", "mood_tracker", "quotes")
+INSERT_BATCH_SIZE = 10000
+
+WORDS = ("sayang", "rindu", "bahagia", "kopi", "hujan", "senja", "kerja", "capek", "jalan", "makan",
+         "film", "musik", "pantai", "kangen", "tertawa", "pelukan", "pagi", "malam", "libur", "rumah")
+
+
+def random_text(rng, length):
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def insert_in_batches(collection, docs):
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+
+def seed(db, couples, moods, quotes, days, seed_value):
+    """Fill the in-memory database with synthetic couples, moods and quotes
+
+    Moods and quotes are spread evenly over the couples; couple 0 is the one the benchmark
+    logs into. Returns the name to log in with.
+    """
+    rng = random.Random(seed_value)
+    now = datetime.now(timezone.utc)
+    couple_ids = [ObjectId() for _ in range(couples)]
+
+    couple_docs = []
+    for i, couple_id in enumerate(couple_ids):
+        couple_docs.append({
+            "_id": couple_id,
+            "couple_code": BENCH_COUPLE_CODE if i == 0 else f"BENCH{i}",
+            "person1_name": f"Satu{i}",
+            "person2_name": f"Dua{i}",
+            "latest_moods": {},
+            "created_at": now - timedelta(days=days),
+        })
+    insert_in_batches(db.couples, couple_docs)
+
+    emojis = list(MOOD_SCORES)
+    latest = {}
+
+    def mood_docs():
+        for i in range(moods):
+            couple_id = str(couple_ids[i % couples])
+            user_id = "person1" if (i // couples) % 2 == 0 else "person2"
+            mood = {
+                "couple_id": couple_id,
+                "user_id": user_id,
+                "mood_emoji": rng.choice(emojis),
+                "mood_note": random_text(rng, rng.randint(0, 12)),
+                "created_at": now - timedelta(seconds=rng.randint(0, days * 86400)),
+            }
+            key = (couple_id, user_id)
+            if key not in latest or latest[key]['created_at'] < mood['created_at']:
+                latest[key] = mood
+            yield mood
+
+    def quote_docs():
+        for i in range(quotes):
+            yield {
+                "couple_id": str(couple_ids[i % couples]),
+                "quote_text": random_text(rng, rng.randint(4, 25)),
+                "author": random_text(rng, 2),
+                "added_by": "person1",
+                "created_at": now - timedelta(seconds=rng.randint(0, days * 86400)),
+                "rand": rng.random(),
+            }
+
+    insert_in_batches(db.moods, mood_docs())
+    insert_in_batches(db.replies, quote_docs())
+
+    # Snapshot mood terbaru seperti yang ditulis CouplesRepo.record_latest_mood
+    for (couple_id, user_id), mood in latest.items():
+        db.couples.update_one(
+            {"_id": ObjectId(couple_id)},
+            {"$set": {f"latest_moods.{user_id}": {k: mood[k] for k in ("mood_emoji", "mood_note", "created_at")}}},
+        )
+
+    return "Satu0"
+
+
+def new_app(timeout):
+    return AppTest.from_file(os.path.join(ROOT, "main.py"), default_timeout=timeout)
+
+
+def timed_run(at):
+    started = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - started
+    if at.exception:
+        raise RuntimeError(f"AppTest exception: {at.exception[0].value}")
+    return elapsed
+
+
+def bench_login(name, timeout):
+    at = new_app(timeout)
+    at.run()
+    inputs = {w.label: w for w in at.text_input}
+    inputs["Nama Kamu"].input(name)
+    inputs["Couple Code"].input(BENCH_COUPLE_CODE)
+    next(b for b in at.button if b.label == "Masuk").click()
+    elapsed = timed_run(at)
+    if not at.session_state["authenticated"]:
+        raise RuntimeError("Login benchmark gagal masuk")
+    return at, elapsed
+
+
+def bench_page(at, page):
+    at.session_state["current_page"] = page
+    return timed_run(at)
+
+
+def summarize(samples):
+    return {
+        "cold_ms": round(samples[0] * 1000, 1),
+        "warm_median_ms": round(statistics.median(samples[1:]) * 1000, 1) if len(samples) > 1 else None,
+        "warm_p95_ms": round(percentile(samples[1:], 95) * 1000, 1) if len(samples) > 1 else None,
+    }
+
+
+def run(args):
+    db = database.get_database(None, backend="memory")
+    started = time.perf_counter()
+    name = seed(db, args.couples, args.moods, args.quotes, args.days, args.seed)
+    print(f"seed: {args.couples} couple, {args.moods} mood, {args.quotes} quote "
+          f"({time.perf_counter() - started:.1f}s)")
+
+    samples = {page: [] for page in PAGES}
+    for i in range(args.runs + 1):
+        # Run pertama dingin (cache baca kosong), sisanya hangat
+        if i == 0:
+            read_cache.clear()
+        at, elapsed = bench_login(name, args.timeout)
+        samples["couple_login"].append(elapsed)
+        for page in PAGES[1:]:
+            samples[page].append(bench_page(at, page))
+
+    return {page: summarize(values) for page, values in samples.items()}
+
+
+def check_regressions(results, baseline, tolerance):
+    """Return the pages whose warm median is slower than the baseline by more than `tolerance`"""
+    regressions = []
+    for page, result in results.items():
+        before = baseline.get(page, {}).get("warm_median_ms")
+        after = result.get("warm_median_ms")
+        if before and after and after > before * (1 + tolerance):
+            regressions.append((page, before, after))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark halaman CeritaKita dengan data sintetis")
+    parser.add_argument("--couples", type=int, default=100)
+    parser.add_argument("--moods", type=int, default=10000, help="total mood (10k-1M)")
+    parser.add_argument("--quotes", type=int, default=10000, help="total quote (10k-1M)")
+    parser.add_argument("--days", type=int, default=365, help="rentang waktu data sintetis")
+    parser.add_argument("--runs", type=int, default=5, help="jumlah run hangat per halaman")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=600, help="batas waktu satu rerun AppTest (detik)")
+    parser.add_argument("--json", help="simpan hasil ke file JSON")
+    parser.add_argument("--baseline", help="file JSON hasil sebelumnya untuk cek regresi")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="toleransi perlambatan, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    print(f"{'halaman':<14}{'dingin':>10}{'median':>10}{'p95':>10}  (ms)")
+    for page, result in results.items():
+        print(f"{page:<14}{result['cold_ms']:>10}{result['warm_median_ms'] or '-':>10}{result['warm_p95_ms'] or '-':>10}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = check_regressions(results, baseline, args.tolerance)
+        for page, before, after in regressions:
+            print(f"REGRESI {page}: {before} ms -> {after} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
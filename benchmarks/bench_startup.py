@@ -0,0 +1,118 @@
+# bench_startup.py - benchmark cold start: waktu import main.py dan render pertama halaman login
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from metrics import percentile
+
+# Modul berat yang seharusnya tidak dimuat sebelum halaman yang membutuhkannya dirender
+DEFERRED_MODULES = ("pandas", "plotly.express")
+
+# Dijalankan di proses Python baru supaya tidak ada modul yang sudah ter-cache
+IMPORT_PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+FIRST_PAINT_PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({main!r}, default_timeout=120)
+started = time.perf_counter()
+at.run()
+elapsed = time.perf_counter() - started
+if at.exception:
+    raise SystemExit(at.exception[0].value)
+if not any(b.label == "Masuk" for b in at.button):
+    raise SystemExit("halaman login tidak dirender")
+# HTML/markdown yang dikirim ulang ke browser di setiap rerun halaman login
+markdown_bytes = sum(len(m.value.encode()) for m in at.markdown)
+print(json.dumps({{"ms": elapsed * 1000, "markdown_bytes": markdown_bytes}}))
+"""
+
+
+def run_probe(source):
+    env = dict(os.environ, CERITAKITA_BACKEND="memory")
+    completed = subprocess.run([sys.executable, "-c", source], capture_output=True, text=True, env=env, cwd=ROOT)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip() or completed.stdout.strip())
+    # Baris terakhir stdout adalah hasil JSON; baris lain berasal dari Streamlit bare mode
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    return {
+        "median_ms": round(statistics.median(samples), 1),
+        "p95_ms": round(percentile(samples, 95), 1),
+    }
+
+
+def run(runs):
+    import_probe = IMPORT_PROBE.format(root=ROOT, deferred=DEFERRED_MODULES)
+    first_paint_probe = FIRST_PAINT_PROBE.format(root=ROOT, main=os.path.join(ROOT, "main.py"))
+
+    import_samples, paint_samples, loaded = [], [], set()
+    for _ in range(runs):
+        result = run_probe(import_probe)
+        import_samples.append(result["ms"])
+        loaded.update(result["loaded"])
+        paint = run_probe(first_paint_probe)
+        paint_samples.append(paint["ms"])
+
+    return {
+        "import_main": summarize(import_samples),
+        "login_first_paint": dict(summarize(paint_samples), markdown_bytes=paint["markdown_bytes"]),
+    }, sorted(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold start CeritaKita (setiap run di proses baru)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="simpan hasil ke file JSON")
+    parser.add_argument("--baseline", help="file JSON hasil sebelumnya untuk cek regresi")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="toleransi perlambatan, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    results, loaded = run(args.runs)
+
+    print(f"{'tahap':<20}{'median':>10}{'p95':>10}  (ms)")
+    for stage, result in results.items():
+        print(f"{stage:<20}{result['median_ms']:>10}{result['p95_ms']:>10}")
+    print(f"markdown per rerun halaman login: {results['login_first_paint']['markdown_bytes']} byte")
+
+    failed = False
+    if loaded:
+        print(f"PERINGATAN: modul berat dimuat saat start: {', '.join(loaded)}")
+        failed = True
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"params": vars(args), "results": results, "deferred_loaded": loaded}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        for stage, result in results.items():
+            before = baseline.get(stage, {}).get("median_ms")
+            if before and result["median_ms"] > before * (1 + args.tolerance):
+                print(f"REGRESI {stage}: {before} ms -> {result['median_ms']} ms")
+                failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# cache.py - cache baca per couple dengan TTL, eviksi LRU, dan invalidasi dari jalur tulis
+
+import threading
+import time
+from collections import OrderedDict
+
+# TTL default per namespace (detik); bisa diubah lewat [cache] di secrets.toml
+DEFAULT_TTLS = {
+    "couple": 300,
+    "latest_moods": 15,
+    "mood_count": 300,
+    "mood_page": 300,
+    "mood_stats": 300,
+    "couple_timeline": 300,
+    "mood_figure": 300,
+    "quote_page": 120,
+    "quote_of_the_day": 24 * 60 * 60,
+}
+
+
+class ReadCache:
+    """Thread-safe TTL cache with LRU eviction, keyed by (namespace, couple_id, user_id, params)
+
+    Values are shared between sessions, so callers must treat them as read-only.
+    """
+
+    def __init__(self, max_entries=5000, default_ttl=60, ttls=None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys_by_couple = {}
+        # Naik setiap invalidate(); hasil loader yang mulai sebelum invalidate tidak disimpan
+        self._generations = {}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+        # Opsional: callable(key, loader) -> (value, fresh) yang dipanggil sebagai ganti loader()
+        self.fallback = None
+
+    def configure(self, max_entries=None, default_ttl=None, ttls=None):
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if default_ttl is not None:
+                self.default_ttl = default_ttl
+            if ttls:
+                self.ttls.update(ttls)
+            self._evict()
+
+    def get_or_load(self, namespace, couple_id, loader, user_id=None, params=()):
+        """Return the cached value for the key, calling loader() on a miss or after expiry
+
+        A value loaded while the couple was invalidated is returned but not cached, since it
+        may predate the write that caused the invalidation.
+        """
+        key = (namespace, couple_id, user_id, params)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                self._remove(key)
+                self._stats["expirations"] += 1
+            self._stats["misses"] += 1
+            generation = self._generations.get(couple_id, 0)
+
+        # Loader dijalankan di luar lock supaya query lambat tidak memblokir sesi lain
+        if self.fallback is None:
+            value = loader()
+        else:
+            value, fresh = self.fallback(key, loader)
+            if not fresh:
+                # Snapshot lama tidak masuk cache supaya data baru langsung terbaca begitu MongoDB pulih
+                return value
+
+        with self._lock:
+            if self._generations.get(couple_id, 0) != generation:
+                return value
+            self._entries[key] = (now + self.ttls.get(namespace, self.default_ttl), value)
+            self._entries.move_to_end(key)
+            self._keys_by_couple.setdefault(couple_id, set()).add(key)
+            self._evict()
+        return value
+
+    def invalidate(self, couple_id, *namespaces, user_id=None):
+        """Drop entries for a couple, optionally limited to namespaces and/or one user's entries"""
+        with self._lock:
+            self._generations[couple_id] = self._generations.get(couple_id, 0) + 1
+            for key in list(self._keys_by_couple.get(couple_id, ())):
+                namespace, _, key_user_id, _ = key
+                if namespaces and namespace not in namespaces:
+                    continue
+                if user_id is not None and key_user_id != user_id:
+                    continue
+                self._remove(key)
+                self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_couple.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._keys_by_couple.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_couple[key[1]]
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self._stats["evictions"] += 1
+
+
+# Satu cache untuk seluruh proses, dipakai bersama oleh semua sesi
+read_cache = ReadCache()
+
+
+def configure_from_secrets(cache_secrets):
+    """Apply the optional [cache] secrets section: max_entries, default_ttl and ttl_<namespace>"""
+    ttls = {
+        key[len("ttl_"):]: int(value)
+        for key, value in cache_secrets.items()
+        if key.startswith("ttl_")
+    }
+    read_cache.configure(
+        max_entries=int(cache_secrets["max_entries"]) if "max_entries" in cache_secrets else None,
+        default_ttl=int(cache_secrets["default_ttl"]) if "default_ttl" in cache_secrets else None,
+        ttls=ttls,
+    )
@@ -0,0 +1,183 @@
+# database.py - koneksi MongoDB bersama untuk seluruh proses CeritaKita
+
+import os
+import threading
+import time
+import tomllib
+from datetime import datetime
+
+from pymongo import MongoClient, monitoring
+from pymongo.errors import ConnectionFailure
+
+import metrics
+
+DATABASE_NAME = "love_message"
+
+# Backend penyimpanan: "mongodb" (default) atau "memory" (mongomock, untuk benchmark/dev)
+BACKEND_ENV = "CERITAKITA_BACKEND"
+BACKENDS = ("mongodb", "memory")
+
+SECRETS_PATH = ".streamlit/secrets.toml"
+
+# Default pool settings; override lewat [mongodb] di .streamlit/secrets.toml
+DEFAULT_CLIENT_OPTIONS = {
+    "maxPoolSize": 50,
+    "minPoolSize": 0,
+    "maxIdleTimeMS": 60000,
+    "serverSelectionTimeoutMS": 5000,
+    "heartbeatFrequencyMS": 10000,
+}
+
+# Nama key di secrets.toml -> nama opsi MongoClient
+SECRET_OPTION_KEYS = {
+    "max_pool_size": "maxPoolSize",
+    "min_pool_size": "minPoolSize",
+    "max_idle_time_ms": "maxIdleTimeMS",
+    "server_selection_timeout_ms": "serverSelectionTimeoutMS",
+    "heartbeat_frequency_ms": "heartbeatFrequencyMS",
+}
+
+# Jeda sebelum mencoba membuat koneksi baru setelah gagal
+RECONNECT_BACKOFF_SECONDS = 10
+
+
+class HealthMonitor(monitoring.ServerHeartbeatListener):
+    """Track server heartbeats that the driver runs in its background monitor threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers = {}
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        with self._lock:
+            self._servers[event.connection_id] = (True, datetime.now(), None)
+
+    def failed(self, event):
+        with self._lock:
+            self._servers[event.connection_id] = (False, datetime.now(), str(event.reply))
+
+    def status(self):
+        """Return (healthy, message); healthy is None until the first heartbeat arrives"""
+        with self._lock:
+            servers = dict(self._servers)
+
+        if not servers:
+            return None, "Menunggu heartbeat pertama"
+
+        healthy = [address for address, (ok, _, _) in servers.items() if ok]
+        if healthy:
+            return True, f"{len(healthy)}/{len(servers)} server sehat"
+
+        last_error = max(servers.values(), key=lambda s: s[1])[2]
+        return False, f"Semua server gagal merespon: {last_error}"
+
+
+_lock = threading.Lock()
+_client = None
+_health = None
+_last_failure = None
+_memory_client = None
+
+
+def get_backend():
+    """Return the storage backend selected by the CERITAKITA_BACKEND environment variable"""
+    backend = os.environ.get(BACKEND_ENV, "mongodb").lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"{BACKEND_ENV} harus salah satu dari {', '.join(BACKENDS)}, bukan {backend!r}")
+    return backend
+
+
+def load_local_secrets(path=SECRETS_PATH):
+    """Read .streamlit/secrets.toml for command-line tools that run outside Streamlit"""
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def load_client_options(mongo_secrets):
+    """Build MongoClient options from the [mongodb] secrets section"""
+    options = dict(DEFAULT_CLIENT_OPTIONS)
+    for secret_key, option_name in SECRET_OPTION_KEYS.items():
+        if secret_key in mongo_secrets:
+            options[option_name] = int(mongo_secrets[secret_key])
+    return options
+
+
+def get_client(uri, options=None, on_unreachable=None):
+    """Return the process-wide MongoClient, creating it on first use
+
+    The client owns a connection pool and background heartbeat threads, so it is
+    shared by every session and every rerun. Creation pings the server once; if
+    that fails the error is re-raised and another attempt is only made after
+    RECONNECT_BACKOFF_SECONDS so a down cluster doesn't stall every rerun.
+
+    With `on_unreachable`, a ping that fails because the server can't be reached is
+    passed to on_unreachable(error) instead and the client is kept; the driver keeps
+    reconnecting in the background. Other errors (e.g. authentication) still raise.
+    """
+    global _client, _health, _last_failure
+
+    if _client is not None:
+        return _client
+
+    with _lock:
+        if _client is not None:
+            return _client
+
+        if _last_failure is not None:
+            failed_at, error = _last_failure
+            if time.monotonic() - failed_at < RECONNECT_BACKOFF_SECONDS:
+                raise error
+
+        health = HealthMonitor()
+        # tz_aware: created_at/updated_at dibaca sebagai datetime UTC yang aware
+        # command_recorder mengukur setiap perintah untuk panel performa
+        client = MongoClient(uri, tz_aware=True, event_listeners=[health, metrics.command_recorder],
+                             **(options or DEFAULT_CLIENT_OPTIONS))
+        try:
+            client.admin.command('ping')
+        except ConnectionFailure as e:
+            if on_unreachable is None:
+                client.close()
+                _last_failure = (time.monotonic(), e)
+                raise
+            on_unreachable(e)
+        except Exception as e:
+            client.close()
+            _last_failure = (time.monotonic(), e)
+            raise
+
+        _client = client
+        _health = health
+        _last_failure = None
+        return _client
+
+
+def get_memory_client():
+    """Return the process-wide in-memory stand-in client (requires mongomock)"""
+    global _memory_client
+
+    with _lock:
+        if _memory_client is None:
+            # Import di sini supaya mongomock hanya dibutuhkan saat backend memory dipakai
+            import mongomock
+            _memory_client = mongomock.MongoClient(tz_aware=True)
+        return _memory_client
+
+
+def get_database(uri, options=None, backend="mongodb", on_unreachable=None):
+    """Return the shared `love_message` database handle for the given backend"""
+    if backend == "memory":
+        return get_memory_client()[DATABASE_NAME]
+    return get_client(uri, options, on_unreachable)[DATABASE_NAME]
+
+
+def health_status():
+    """Return (healthy, message) based on the background heartbeats"""
+    if _memory_client is not None:
+        return True, "Backend in-memory"
+    if _health is None:
+        return False, "Belum terhubung"
+    return _health.status()
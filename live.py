@@ -0,0 +1,232 @@
+# live.py - pemberitahuan mood baru pasangan lewat change stream, dengan fallback polling
+
+import argparse
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+import database
+import repository
+from cache import read_cache
+
+# Interval polling saat change stream tidak tersedia (detik)
+POLL_INTERVAL_SECONDS = 5
+# Jendela tumpang tindih polling untuk mood yang created_at-nya sedikit lebih lama dari commit-nya
+POLL_OVERLAP_SECONDS = 5
+# Couple yang tidak dibuka sesi mana pun selama ini berhenti dipantau
+SUBSCRIPTION_TTL_SECONDS = 120
+# Jeda sebelum membuka ulang change stream setelah error jaringan
+RETRY_SECONDS = 5
+
+# Kode error MongoDB saat $changeStream tidak didukung (standalone, engine lama)
+CHANGE_STREAM_UNSUPPORTED = {40573, 40324, 136}
+
+logger = logging.getLogger("ceritakita.live")
+
+
+class MoodWatcher:
+    """Process-wide watcher that bumps a per-couple version whenever a mood is inserted
+
+    Sessions call subscribe() to register a couple and read its version; a changed version
+    means a new mood arrived. One background thread serves all sessions, using a change
+    stream filtered to the subscribed couples, or incremental polling on created_at when
+    change streams are unavailable. With `buckets`, `collection` is mood_buckets, where a
+    new mood is an update of its bucket and polling follows last_created_at.
+    """
+
+    def __init__(self, collection, change_streams=True, poll_interval=POLL_INTERVAL_SECONDS,
+                 subscription_ttl=SUBSCRIPTION_TTL_SECONDS, buckets=False):
+        self.collection = collection
+        self.change_streams = change_streams
+        self.buckets = buckets
+        self.time_field = "last_created_at" if buckets else "created_at"
+        self.poll_interval = poll_interval
+        self.subscription_ttl = subscription_ttl
+        self.mode = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._versions = {}
+        self._subscriptions_changed = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, couple_id):
+        """Register interest in a couple (refreshes its TTL) and return its current version"""
+        with self._lock:
+            is_new = couple_id not in self._subscribers
+            self._subscribers[couple_id] = time.monotonic()
+            version = self._versions.get(couple_id, 0)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ceritakita-mood-watcher", daemon=True)
+                self._thread.start()
+        if is_new:
+            self._subscriptions_changed.set()
+        return version
+
+    def version(self, couple_id):
+        with self._lock:
+            return self._versions.get(couple_id, 0)
+
+    def stop(self):
+        self._stop.set()
+        self._subscriptions_changed.set()
+
+    def _couple_ids(self):
+        """Subscribed couples, dropping the ones no session has touched within the TTL"""
+        cutoff = time.monotonic() - self.subscription_ttl
+        with self._lock:
+            for couple_id, touched_at in list(self._subscribers.items()):
+                if touched_at < cutoff:
+                    del self._subscribers[couple_id]
+            return sorted(self._subscribers)
+
+    def _notify(self, couple_id, user_id):
+        with self._lock:
+            self._versions[couple_id] = self._versions.get(couple_id, 0) + 1
+        # Mood bisa ditulis proses lain, jadi cache proses ini ikut dibuang
+        read_cache.invalidate(couple_id, "latest_moods", "couple_timeline")
+        if user_id:
+            read_cache.invalidate(couple_id, user_id=user_id)
+
+    def _run(self):
+        while self.change_streams and not self._stop.is_set():
+            try:
+                self._watch()
+            except OperationFailure as e:
+                if e.code not in CHANGE_STREAM_UNSUPPORTED:
+                    self._retry_later(e)
+                    continue
+                logger.info("change stream tidak tersedia (%s), beralih ke polling", e)
+                break
+            except PyMongoError as e:
+                self._retry_later(e)
+
+        while not self._stop.is_set():
+            try:
+                self._poll()
+            except PyMongoError as e:
+                self._retry_later(e)
+
+    def _retry_later(self, error):
+        self.last_error = error
+        logger.warning("mood watcher error: %s", error)
+        self._stop.wait(RETRY_SECONDS)
+
+    def _wait_for_subscribers(self):
+        couple_ids = self._couple_ids()
+        self._subscriptions_changed.clear()
+        if not couple_ids:
+            self._subscriptions_changed.wait(self.poll_interval)
+        return couple_ids
+
+    def _watch(self):
+        resume_token = None
+        while not self._stop.is_set():
+            couple_ids = self._wait_for_subscribers()
+            if not couple_ids:
+                continue
+
+            # Stream dibuka ulang (dari resume token) setiap kali daftar couple berubah
+            operations = ["insert", "update"] if self.buckets else ["insert"]
+            pipeline = [
+                {"$match": {"operationType": {"$in": operations}, "fullDocument.couple_id": {"$in": couple_ids}}},
+                {"$project": {"fullDocument.couple_id": 1, "fullDocument.user_id": 1}},
+            ]
+            # Update bucket hanya membawa field yang berubah; couple_id diambil dari dokumen terkini
+            full_document = "updateLookup" if self.buckets else None
+            with self.collection.watch(pipeline, resume_after=resume_token, max_await_time_ms=1000,
+                                       full_document=full_document) as stream:
+                self.mode = "change_stream"
+                self.last_error = None
+                while not self._stop.is_set() and not self._subscriptions_changed.is_set():
+                    change = stream.try_next()
+                    resume_token = stream.resume_token
+                    if change is not None and change.get("fullDocument"):
+                        mood = change["fullDocument"]
+                        self._notify(mood["couple_id"], mood.get("user_id"))
+                    elif self._couple_ids() != couple_ids:
+                        break
+
+    def _poll(self):
+        self.mode = "polling"
+        last_seen = datetime.now(timezone.utc)
+        seen_ids = {}
+        while not self._stop.is_set():
+            couple_ids = self._wait_for_subscribers()
+            if not couple_ids:
+                continue
+
+            since = last_seen - timedelta(seconds=POLL_OVERLAP_SECONDS)
+            cursor = self.collection.find(
+                {"couple_id": {"$in": couple_ids}, self.time_field: {"$gt": since}},
+                {"couple_id": 1, "user_id": 1, self.time_field: 1},
+            )
+            for mood in cursor:
+                # Bucket yang sama muncul lagi setiap kali mood baru ditambahkan ke dalamnya
+                created_at = mood[self.time_field]
+                seen_key = (mood["_id"], created_at)
+                if seen_key in seen_ids:
+                    continue
+                seen_ids[seen_key] = created_at
+                last_seen = max(last_seen, created_at)
+                self._notify(mood["couple_id"], mood.get("user_id"))
+            self.last_error = None
+
+            # Id yang sudah di luar jendela tumpang tindih tidak perlu diingat lagi
+            cutoff = last_seen - timedelta(seconds=POLL_OVERLAP_SECONDS)
+            seen_ids = {key: created_at for key, created_at in seen_ids.items() if created_at > cutoff}
+            self._stop.wait(self.poll_interval)
+
+
+_lock = threading.Lock()
+_mood_watcher = None
+
+
+def get_mood_watcher(collection, change_streams=True, buckets=False):
+    """Return the process-wide MoodWatcher, creating it on first use"""
+    global _mood_watcher
+
+    with _lock:
+        if _mood_watcher is None:
+            _mood_watcher = MoodWatcher(collection, change_streams=change_streams, buckets=buckets)
+        return _mood_watcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pantau mood baru satu couple (uji change stream)")
+    parser.add_argument("couple_id")
+    parser.add_argument("--uri", help="URI MongoDB; default dari .streamlit/secrets.toml")
+    parser.add_argument("--polling", action="store_true", help="paksa mode polling")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.uri:
+        db = database.get_database(args.uri)
+        moods_secrets = None
+    else:
+        secrets = database.load_local_secrets()
+        db = database.get_database(secrets["mongodb"]["uri"], database.load_client_options(secrets["mongodb"]))
+        moods_secrets = secrets.get("moods")
+
+    buckets = repository.get_mood_storage(moods_secrets) == "bucket"
+    collection = db[repository.BUCKET_COLLECTION] if buckets else db.moods
+    watcher = get_mood_watcher(collection, change_streams=not args.polling, buckets=buckets)
+    version = watcher.subscribe(args.couple_id)
+    print(f"memantau couple {args.couple_id}, Ctrl+C untuk berhenti")
+    try:
+        while True:
+            time.sleep(1)
+            current = watcher.subscribe(args.couple_id)
+            if current != version:
+                print(f"[{watcher.mode}] {current - version} mood baru")
+                version = current
+    except KeyboardInterrupt:
+        watcher.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,39 @@
 # app.py - CeritaKita without formal authentication
 
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import functools
+import io
 import random
-from pymongo import MongoClient
-from bson.objectid import ObjectId
+import uuid
+from pymongo.errors import DuplicateKeyError
 import traceback
 
+import cache
+import database
+import live
+import metrics
+import migrations
+import offline
+import parallel
+import repository
+import theme
+import transfer
+from cache import read_cache
+from repository import parse_timestamp
+
 # Aktifkan mode debug
 debug_mode = False
 
+# Quote di dashboard: "random" = acak setiap rerun, "daily" = satu quote tetap per couple per hari
+quote_of_the_day_mode = "random"
+
+# Batas waktu (detik) untuk setiap pembacaan dashboard yang dijalankan bersamaan
+dashboard_fetch_timeout = 3.0
+
+# Seberapa sering dashboard memeriksa mood baru pasangan (detik); pemeriksaan hanya membaca memori
+live_refresh_seconds = 5
+
 # Set page config di awal
 st.set_page_config(
     page_title="CeritaKita",
@@ -20,18 +42,44 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+# Ukur rerun ini; query MongoDB di dalamnya ditandai dengan halaman yang sedang dibuka.
+# Ukuran perintah/balasan hanya diukur selama panel performa sesi ini terbuka
+if st.session_state.get("authenticated"):
+    rerun_metrics = metrics.begin_rerun(st.session_state.get("current_page", "dashboard"),
+                                        measure_bytes=st.session_state.get("show_performance_panel", False))
+else:
+    rerun_metrics = metrics.begin_rerun("login")
+
 # Debug info
 if debug_mode:
     st.info("Mode debug aktif")
     st.write("Python packages:")
     st.write(f"- Streamlit: {st.__version__}")
+    # pandas/plotly tidak diimport di awal supaya login dan dashboard start lebih cepat
+    import pandas as pd
+    import plotly
     st.write(f"- Pandas: {pd.__version__}")
-    st.write(f"- Plotly: {px.__version__}")
+    st.write(f"- Plotly: {plotly.__version__}")
 
 # MongoDB setup - memeriksa apakah dalam produksi atau pengembangan
 try:
-    # Coba gunakan Streamlit secrets (production)
-    mongodb_uri = st.secrets["mongodb"]["uri"]
+    backend = database.get_backend()
+    if backend == "memory":
+        # Backend in-memory (benchmark/dev) tidak butuh secrets MongoDB
+        mongodb_uri = None
+        mongodb_options = {}
+        mood_storage = repository.get_mood_storage()
+    else:
+        # Coba gunakan Streamlit secrets (production)
+        mongodb_uri = st.secrets["mongodb"]["uri"]
+        mongodb_options = database.load_client_options(st.secrets["mongodb"])
+        cache.configure_from_secrets(st.secrets.get("cache", {}))
+        metrics.configure_from_secrets(st.secrets.get("metrics", {}))
+        theme.configure_from_secrets(st.secrets.get("theme", {}))
+        mood_storage = repository.get_mood_storage(st.secrets.get("moods", {}))
+        # Snapshot baca dan antrean tulis lokal untuk saat MongoDB tidak terjangkau
+        offline.configure_from_secrets(st.secrets.get("offline", {}),
+                                       health_check=lambda: database.health_status()[0])
     if debug_mode:
         st.success("Berhasil membaca secrets MongoDB")
 except Exception as e:
@@ -43,12 +91,14 @@ except Exception as e:
     # Hentikan eksekusi jika tidak ada koneksi database
     st.stop()
 
-# Coba sambungkan ke database
+# Gunakan koneksi bersama; dibuat sekali per proses, bukan setiap rerun
 try:
-    client = MongoClient(mongodb_uri, serverSelectionTimeoutMS=5000)
-    # Verifikasi koneksi dengan ping
-    client.admin.command('ping')
-    db = client.love_message
+    # Dengan snapshot aktif, server yang tidak terjangkau membuka breaker alih-alih menghentikan aplikasi
+    db = database.get_database(mongodb_uri, mongodb_options, backend,
+                               on_unreachable=offline.breaker.trip if offline.snapshots is not None else None)
+    repos = repository.create_repositories(db, backend, mood_storage)
+    mood_watcher = live.get_mood_watcher(repos.moods.collection, change_streams=backend == "mongodb",
+                                         buckets=mood_storage == "bucket")
     if debug_mode:
         st.success("Berhasil terhubung ke MongoDB")
 except Exception as e:
@@ -58,22 +108,127 @@ except Exception as e:
         st.error(traceback.format_exc())
     st.stop()
 
-# Helper functions for MongoDB
-def object_id_to_str(data):
-    """Convert ObjectId to string in MongoDB documents"""
-    if isinstance(data, dict):
-        for k, v in data.items():
-            if isinstance(v, ObjectId):
-                data[k] = str(v)
-            elif isinstance(v, (dict, list)):
-                data[k] = object_id_to_str(v)
-    elif isinstance(data, list):
-        for i, v in enumerate(data):
-            if isinstance(v, ObjectId):
-                data[i] = str(v)
-            elif isinstance(v, (dict, list)):
-                data[i] = object_id_to_str(v)
-    return data
+# Buat index dan jalankan migrasi skema sekali per proses (ditunda selama database tidak terjangkau)
+try:
+    applied_migrations = [] if offline.degraded() else migrations.ensure_migrated(db)
+    if debug_mode and applied_migrations:
+        st.success(f"Migrasi dijalankan: {', '.join(applied_migrations)}")
+except Exception as e:
+    st.warning(f"Migrasi database gagal: {e}")
+    if debug_mode:
+        st.error(traceback.format_exc())
+
+# Kirim tulisan yang diantrekan selama database tidak terjangkau, sesuai urutan
+for queued_doc in offline.flush({"moods": repos.moods.add, "quotes": repos.quotes.add}):
+    read_cache.invalidate(queued_doc['couple_id'])
+
+# Label pilihan grafik -> unit $dateTrunc
+CHART_GRANULARITIES = {"Harian": "day", "Mingguan": "week", "Bulanan": "month"}
+
+# Sumbu y grafik mood: skor 1 (paling bahagia) di atas
+MOOD_CHART_YAXIS = dict(
+    tickvals=[1, 2, 3, 4, 5],
+    ticktext=["😍", "😊", "😐", "😔", "😢"],
+    autorange="reversed"
+)
+
+# Warna teks grafik per tema; latar grafik transparan mengikuti kartu
+CHART_FONT_COLORS = {"light": "#333333", "dark": "#F0F0F0"}
+
+# Jumlah quote per halaman koleksi
+QUOTE_LIST_PAGE_SIZE = 10
+
+# Jumlah entri per halaman riwayat mood
+MOOD_HISTORY_PAGE_SIZE = 5
+
+def render_pager(state_key, next_cursor):
+    """Newer/older buttons for a list whose page cursors are kept in st.session_state[state_key]"""
+    cursors = st.session_state[state_key]
+    if len(cursors) == 1 and not next_cursor:
+        return
+
+    # Callback mengubah kursor sebelum rerun, jadi di dalam fragment hanya fragment itu yang dijalankan ulang
+    col_prev, col_page, col_next = st.columns([1, 1, 1])
+    with col_prev:
+        if len(cursors) > 1:
+            st.button("⬅️ Lebih baru", key=f"{state_key}_newer", use_container_width=True, on_click=cursors.pop)
+    with col_page:
+        st.markdown(f"<p style='text-align: center;'>Halaman {len(cursors)}</p>", unsafe_allow_html=True)
+    with col_next:
+        if next_cursor:
+            st.button("Lebih lama ➡️", key=f"{state_key}_older", use_container_width=True,
+                      on_click=cursors.append, args=(next_cursor,))
+
+# Jumlah hasil per halaman pencarian
+SEARCH_PAGE_SIZE = 10
+
+def search_page(state_key, query):
+    """Current result page for a search box; goes back to the first page when the query changes"""
+    if st.session_state.get(f"{state_key}_query") != query:
+        st.session_state[f"{state_key}_query"] = query
+        st.session_state[f"{state_key}_page"] = 0
+    return st.session_state[f"{state_key}_page"]
+
+def render_search_pager(state_key, has_more):
+    """Previous/next buttons for ranked search results, which are paged by position"""
+    page = st.session_state[f"{state_key}_page"]
+    if page == 0 and not has_more:
+        return
+
+    def go_to(new_page):
+        st.session_state[f"{state_key}_page"] = new_page
+
+    col_prev, col_page, col_next = st.columns([1, 1, 1])
+    with col_prev:
+        if page > 0:
+            st.button("⬅️ Sebelumnya", key=f"{state_key}_prev", use_container_width=True, on_click=go_to, args=(page - 1,))
+    with col_page:
+        st.markdown(f"<p style='text-align: center;'>Halaman {page + 1}</p>", unsafe_allow_html=True)
+    with col_next:
+        if has_more:
+            st.button("Berikutnya ➡️", key=f"{state_key}_next", use_container_width=True, on_click=go_to, args=(page + 1,))
+
+def submission_key(form, content):
+    """Idempotency key of the form's current submission; the same until rotate_submission_key()
+
+    A double click or a retry after an error sends the same key again, and the unique index
+    on idempotency_key keeps the write from being saved twice. Submitting different
+    `content` starts a new submission with a new key.
+    """
+    state_key = f"{form}_idempotency_key"
+    current = st.session_state.get(state_key)
+    if current is None or current[0] != content:
+        current = st.session_state[state_key] = (content, uuid.uuid4().hex)
+    return current[1]
+
+def rotate_submission_key(form):
+    """Start a new submission once the current one is saved or queued"""
+    st.session_state.pop(f"{form}_idempotency_key", None)
+
+def page_fragment(name, run_every=None):
+    """st.fragment whose reruns show up in the performance panel
+
+    A widget inside the fragment reruns only the fragment; that rerun is recorded as page
+    "<page>/<name>". During a full rerun the fragment's own time is kept in the rerun's
+    `fragments`, so both costs of an interaction can be compared.
+    """
+    def decorator(func):
+        @st.fragment(run_every=run_every)
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rerun = metrics.current_rerun()
+            if rerun is not None:
+                with rerun.fragment(name):
+                    return func(*args, **kwargs)
+            # Rerun fragment saja: bagian atas script tidak dijalankan, jadi diukur di sini
+            rerun = metrics.begin_rerun(f"{st.session_state.get('current_page', 'dashboard')}/{name}",
+                                        measure_bytes=st.session_state.get("show_performance_panel", False))
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.end_rerun(rerun)
+        return wrapper
+    return decorator
 
 # Initialize session state
 if 'authenticated' not in st.session_state:
@@ -89,127 +244,12 @@ def toggle_theme():
     else:
         st.session_state.theme_mode = 'light'
 
-# Custom CSS
+def go_to_page(page):
+    st.session_state.current_page = page
+
+# Custom CSS: stylesheet statis dari theme.py; ganti tema hanya menambah/menghapus elemen penanda
 def apply_custom_css():
-    theme_mode = st.session_state.theme_mode
-    
-    if theme_mode == 'light':
-        bg_color = "#F8F0FC"
-        text_color = "#333333"
-        card_bg_color = "white"
-        card_shadow = "0 4px 6px rgba(0, 0, 0, 0.05)"
-        quote_bg = "#EBDFFC"
-    else:  # dark mode
-        bg_color = "#121212"
-        text_color = "#F0F0F0"
-        card_bg_color = "#1E1E1E"
-        card_shadow = "0 4px 6px rgba(0, 0, 0, 0.2)"
-        quote_bg = "#2D2D2D"
-    
-    st.markdown(f"""
-    <style>
-    :root {{
-        --primary-color: #BFA2DB;
-        --bg-color: {bg_color};
-        --text-color: {text_color};
-        --accent-color: #9A73C7;
-        --card-bg-color: {card_bg_color};
-        --card-shadow: {card_shadow};
-        --quote-bg: {quote_bg};
-    }}
-    
-    .stApp {{
-        background-color: var(--bg-color);
-        color: var(--text-color);
-        font-family: 'Quicksand', sans-serif;
-    }}
-    
-    .main-header {{
-        color: var(--primary-color);
-        font-size: 2.5rem;
-        font-weight: 700;
-        text-align: center;
-        margin-bottom: 1rem;
-    }}
-    
-    .sub-header {{
-        color: var(--accent-color);
-        font-size: 1.5rem;
-        font-weight: 600;
-        margin-top: 2rem;
-    }}
-    
-    .card {{
-        background-color: var(--card-bg-color);
-        border-radius: 15px;
-        padding: 1.5rem;
-        box-shadow: var(--card-shadow);
-        margin: 1rem 0;
-    }}
-    
-    .mood-emoji {{
-        font-size: 2rem;
-    }}
-    
-    .stButton > button {{
-        background-color: var(--primary-color);
-        color: white;
-        border-radius: 20px;
-        border: none;
-        padding: 0.5rem 1.5rem;
-        font-weight: 500;
-    }}
-    
-    .stButton > button:hover {{
-        background-color: var(--accent-color);
-    }}
-    
-    /* Login form submit button styling */
-    .stButton button[kind="formSubmit"] {{
-        background-color: var(--primary-color);
-        color: white;
-        width: 100%;
-        border-radius: 20px;
-        padding: 0.6rem 0;
-        margin-top: 1rem;
-        font-weight: 600;
-        font-size: 1.1rem;
-        transition: all 0.3s ease;
-    }}
-    
-    .stButton button[kind="formSubmit"]:hover {{
-        background-color: var(--accent-color);
-        transform: translateY(-2px);
-    }}
-    
-    .quote-box {{
-        background-color: var(--quote-bg);
-        border-radius: 10px;
-        padding: 1rem;
-        font-style: italic;
-        text-align: center;
-    }}
-    
-    div.stTextInput > div > div > input {{
-        border-radius: 10px;
-        border: 1px solid var(--primary-color);
-    }}
-    
-    .sidebar-header {{
-        text-align: center;
-        margin-bottom: 1.5rem;
-    }}
-    
-    .theme-toggle {{
-        position: absolute;
-        top: 10px;
-        right: 10px;
-        z-index: 1000;
-    }}
-    </style>
-    
-    <link href="https://fonts.googleapis.com/css2?family=Quicksand:wght@400;500;600;700&display=swap" rel="stylesheet">
-    """, unsafe_allow_html=True)
+    st.markdown(theme.theme_html(st.session_state.theme_mode), unsafe_allow_html=True)
 
 apply_custom_css()
 
@@ -220,35 +260,54 @@ def couple_login(couple_code, name):
     
     try:
         # Check if couple exists
-        couple = db.couples.find_one({"couple_code": couple_code})
+        couple = repos.couples.find_by_code(couple_code)
+        
+        if not couple:
+            # Couple doesn't exist, create new
+            try:
+                new_couple_id = repos.couples.create(couple_code, name, datetime.now(timezone.utc))
+                
+                if new_couple_id:
+                    st.session_state.user_id = "person1"
+                    st.session_state.user_name = name
+                    st.session_state.partner_name = None
+                    st.session_state.couple_id = new_couple_id
+                    st.session_state.couple_code = couple_code
+                    return True, "Kamu telah membuat couple baru! Bagikan couple code ini dengan pasanganmu."
+                else:
+                    return False, "Gagal membuat couple baru"
+            except DuplicateKeyError:
+                # Couple code yang sama baru saja dibuat sesi lain, lanjut sebagai couple yang sudah ada
+                couple = repos.couples.find_by_code(couple_code)
         
         if couple:
             # Couple exists, check if user is part of it
-            couple = object_id_to_str(couple)
-            if couple['person1_name'] == name:
+            if couple.person1_name == name:
                 st.session_state.user_id = "person1"
                 st.session_state.user_name = name
-                st.session_state.partner_name = couple['person2_name']
-                st.session_state.couple_id = str(couple['_id'])
+                st.session_state.partner_name = couple.person2_name
+                st.session_state.couple_id = couple.id
                 st.session_state.couple_code = couple_code
                 return True, "Login berhasil sebagai Person 1!"
             
-            elif couple['person2_name'] == name:
+            elif couple.person2_name == name:
                 st.session_state.user_id = "person2"
                 st.session_state.user_name = name
-                st.session_state.partner_name = couple['person1_name']
-                st.session_state.couple_id = str(couple['_id'])
+                st.session_state.partner_name = couple.person1_name
+                st.session_state.couple_id = couple.id
                 st.session_state.couple_code = couple_code
                 return True, "Login berhasil sebagai Person 2!"
             
-            elif not couple['person2_name']:
+            elif not couple.person2_name:
                 # Person 2 doesn't exist yet, register as person 2
-                db.couples.update_one({"_id": couple['_id']}, {"$set": {"person2_name": name}})
+                if not repos.couples.join_as_person2(couple.id, name):
+                    return False, "Pasangan sudah penuh, coba login lagi"
+                read_cache.invalidate(couple.id, "couple")
                 
                 st.session_state.user_id = "person2"
                 st.session_state.user_name = name
-                st.session_state.partner_name = couple['person1_name']
-                st.session_state.couple_id = str(couple['_id'])
+                st.session_state.partner_name = couple.person1_name
+                st.session_state.couple_id = couple.id
                 st.session_state.couple_code = couple_code
                 return True, "Selamat datang! Kamu berhasil bergabung sebagai Person 2!"
             
@@ -256,23 +315,7 @@ def couple_login(couple_code, name):
                 return False, "Nama tidak cocok dengan couple code ini atau pasangan sudah penuh"
         
         else:
-            # Couple doesn't exist, create new
-            new_couple = db.couples.insert_one({
-                "couple_code": couple_code,
-                "person1_name": name,
-                "person2_name": None,
-                "created_at": datetime.now().isoformat()
-            })
-            
-            if new_couple.inserted_id:
-                st.session_state.user_id = "person1"
-                st.session_state.user_name = name
-                st.session_state.partner_name = None
-                st.session_state.couple_id = str(new_couple.inserted_id)
-                st.session_state.couple_code = couple_code
-                return True, "Kamu telah membuat couple baru! Bagikan couple code ini dengan pasanganmu."
-            else:
-                return False, "Gagal membuat couple baru"
+            return False, "Gagal membuat couple baru"
     
     except Exception as e:
         return False, f"Error: {str(e)}"
@@ -287,9 +330,7 @@ def logout():
 def render_login_page():
     # Theme toggle
     theme_icon = "🌙" if st.session_state.theme_mode == "light" else "☀️"
-    if st.button(f"{theme_icon} Ganti Tema", key="theme_toggle_login"):
-        toggle_theme()
-        st.rerun()
+    st.button(f"{theme_icon} Ganti Tema", key="theme_toggle_login", on_click=toggle_theme)
         
     st.markdown("<h1 class='main-header'>💜 CeritaKita</h1>", unsafe_allow_html=True)
     st.markdown("<p style='text-align: center;'>Cerita cinta kita berdua dalam aplikasi yang manis</p>", unsafe_allow_html=True)
@@ -317,6 +358,16 @@ def render_login_page():
                 st.error(message)
     st.markdown("</div>", unsafe_allow_html=True)
 
+# Live partner mood: the fragment reruns on a timer and only reads the watcher's in-memory version
+@page_fragment("live_mood", run_every=live_refresh_seconds)
+def watch_partner_mood(couple_id):
+    version = mood_watcher.subscribe(couple_id)
+    if version != st.session_state.get("live_mood_version"):
+        st.session_state.live_mood_version = version
+        st.rerun()
+    mode_label = {"change_stream": "langsung", "polling": f"setiap {live.POLL_INTERVAL_SECONDS} detik"}
+    st.caption(f"🔄 Mood pasangan diperbarui otomatis ({mode_label.get(mood_watcher.mode, 'menyiapkan')})")
+
 # Dashboard page
 def render_dashboard():
     st.markdown(f"<h1 class='main-header'>CeritaKita</h1>", unsafe_allow_html=True)
@@ -326,6 +377,28 @@ def render_dashboard():
     user_name = st.session_state.user_name
     partner_name = st.session_state.get('partner_name', 'pasanganmu')
     couple_id = st.session_state.couple_id
+    today = datetime.now().date().isoformat()
+    
+    # Versi mood couple saat data di bawah dibaca; watch_partner_mood membandingkannya
+    st.session_state.live_mood_version = mood_watcher.subscribe(str(couple_id))
+    
+    # Mood terbaru dan quote dibaca bersamaan; bagian yang gagal tidak menghalangi yang lain
+    dashboard_loaders = {
+        "latest_moods": lambda: read_cache.get_or_load("latest_moods", str(couple_id),
+                                                       lambda: repos.couples.latest_moods(str(couple_id))),
+        "mood_stats": lambda: read_cache.get_or_load("mood_stats", str(couple_id),
+                                                     lambda: repos.mood_stats.summary(str(couple_id), user_id),
+                                                     user_id=user_id),
+    }
+    if quote_of_the_day_mode == "daily":
+        dashboard_loaders["quote"] = lambda: read_cache.get_or_load(
+            "quote_of_the_day", str(couple_id),
+            lambda: repos.quotes.quote_of_the_day(str(couple_id), today),
+            params=(today,),
+        )
+    else:
+        dashboard_loaders["quote"] = lambda: offline.breaker.call(lambda: repos.quotes.sample(str(couple_id)))
+    dashboard_data = parallel.fetch_all(dashboard_loaders, timeout=dashboard_fetch_timeout)
     
     # Welcome message
     st.markdown(f"<div class='card'><h3>Halo, {user_name}! 👋</h3>", unsafe_allow_html=True)
@@ -338,16 +411,15 @@ def render_dashboard():
     
     # Get latest moods
     try:
-        my_mood = db.moods.find_one({"couple_id": str(couple_id), "user_id": user_id}, sort=[("created_at", -1)])
-        if my_mood:
-            my_mood = object_id_to_str(my_mood)
+        latest_moods, error = dashboard_data["latest_moods"]
+        if error:
+            raise error
+        my_mood = latest_moods.get(user_id)
         
         partner_id = "person1" if user_id == "person2" else "person2"
         partner_moods = None
         if partner_name:
-            partner_moods = db.moods.find_one({"couple_id": str(couple_id), "user_id": partner_id}, sort=[("created_at", -1)])
-            if partner_moods:
-                partner_moods = object_id_to_str(partner_moods)
+            partner_moods = latest_moods.get(partner_id)
         
         with col1:
             st.markdown("<p><b>Mood Kamu:</b></p>", unsafe_allow_html=True)
@@ -375,18 +447,30 @@ def render_dashboard():
     except Exception as e:
         st.error(f"Error fetching moods: {str(e)}")
     
+    watch_partner_mood(str(couple_id))
     st.markdown("</div>", unsafe_allow_html=True)
     
+    # Mood statistics
+    try:
+        stats, error = dashboard_data["mood_stats"]
+        if error:
+            raise error
+        if stats["count"]:
+            render_mood_stats_card(stats)
+    except Exception as e:
+        st.error(f"Error fetching mood stats: {str(e)}")
+    
     # Quote of the day
     st.markdown("<div class='card'>", unsafe_allow_html=True)
     st.markdown("<h3 class='sub-header'>Quote Hari Ini</h3>", unsafe_allow_html=True)
     
-    # Get a random quote from the database
+    # Get one quote from the database without loading the whole collection
     try:
-        quotes = list(db.replies.find({"couple_id": str(couple_id)}))
-        quotes = object_id_to_str(quotes)
-        if quotes:
-            quote = random.choice(quotes)
+        quote, error = dashboard_data["quote"]
+        # Quote acak tidak punya snapshot; saat MongoDB tidak terjangkau tampilkan quote bawaan
+        if error and not offline.is_connection_error(error):
+            raise error
+        if quote:
             st.markdown(f"<div class='quote-box'>\"{quote['quote_text']}\"</div>", unsafe_allow_html=True)
             st.markdown(f"<p style='text-align: right; font-style: italic;'>— {quote['author']}</p>", unsafe_allow_html=True)
         else:
@@ -397,7 +481,10 @@ def render_dashboard():
                 {"text": "Mencintai bukan hanya tentang siapa yang membuatmu tertawa, tetapi siapa yang membuatmu bahagia.", "author": "Anonymous"},
                 {"text": "Cinta sejati tidak pernah berakhir. Cinta sejati adalah api abadi.", "author": "Bruce Lee"}
             ]
-            random_quote = random.choice(default_quotes)
+            if quote_of_the_day_mode == "daily":
+                random_quote = random.Random(f"{couple_id}:{today}").choice(default_quotes)
+            else:
+                random_quote = random.choice(default_quotes)
             st.markdown(f"<div class='quote-box'>\"{random_quote['text']}\"</div>", unsafe_allow_html=True)
             st.markdown(f"<p style='text-align: right; font-style: italic;'>— {random_quote['author']}</p>", unsafe_allow_html=True)
     except Exception as e:
@@ -405,14 +492,179 @@ def render_dashboard():
     
     st.markdown("</div>", unsafe_allow_html=True)
 
+def mood_score_label(score):
+    """Average score with the emoji closest to it, e.g. "😊 2.3" """
+    if score is None:
+        return "-"
+    emoji = min(repository.MOOD_SCORES, key=lambda e: abs(repository.MOOD_SCORES[e] - score))
+    return f"{emoji} {score:.1f}"
+
+def render_mood_stats_card(stats, show_distribution=False):
+    st.markdown("<div class='card'>", unsafe_allow_html=True)
+    st.markdown("<h3>Statistik Mood Kamu</h3>", unsafe_allow_html=True)
+    
+    col_streak, col_longest, col_week, col_month = st.columns(4)
+    col_streak.metric("🔥 Streak", f"{stats['current_streak']} hari")
+    col_longest.metric("Terpanjang", f"{stats['longest_streak']} hari")
+    col_week.metric("Rata-rata 7 hari", mood_score_label(stats['average_7d']), f"{stats['count_7d']} entri",
+                    delta_color="off")
+    col_month.metric("Rata-rata 30 hari", mood_score_label(stats['average_30d']), f"{stats['count_30d']} entri",
+                     delta_color="off")
+    
+    if show_distribution:
+        distribution = " · ".join(f"{emoji} {count}" for emoji, count in stats['distribution'].items())
+        st.markdown(f"<p>{distribution} — total {stats['count']} entri</p>", unsafe_allow_html=True)
+    
+    st.markdown("</div>", unsafe_allow_html=True)
+
+def mood_data_version(couple_id, user_id):
+    """Revision of the user's stats document, bumped by every saved mood"""
+    stats = read_cache.get_or_load("mood_stats", couple_id,
+                                   lambda: repos.mood_stats.summary(couple_id, user_id),
+                                   user_id=user_id)
+    return stats["version"]
+
+def style_mood_figure(fig, theme_mode, **layout):
+    """Shared layout of the mood charts, colored for the current theme"""
+    fig.update_layout(
+        yaxis=MOOD_CHART_YAXIS,
+        height=300,
+        margin=dict(l=10, r=10, t=10, b=10),
+        font=dict(color=CHART_FONT_COLORS[theme_mode]),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        **layout
+    )
+    return fig
+
+def build_mood_figure(buckets, theme_mode):
+    """Line figure of one user's mood per period, or None when the range is empty"""
+    if not buckets:
+        return None
+    
+    # Diimport saat grafik pertama dibuat, bukan saat script dimulai
+    import pandas as pd
+    import plotly.express as px
+    
+    # Plot mood history, satu titik per periode
+    fig = px.line(
+        pd.DataFrame(buckets),
+        x='period',
+        y='score',
+        labels={'score': 'Mood', 'period': 'Tanggal', 'count': 'Jumlah entri'},
+        hover_data=['count'],
+        markers=True,
+        color_discrete_sequence=['#BFA2DB']
+    )
+    return style_mood_figure(fig, theme_mode)
+
+def build_couple_figure(series, names, theme_mode):
+    """Both partners' mood lines in one figure, or None when the range is empty"""
+    if not series:
+        return None
+    
+    import pandas as pd
+    import plotly.express as px
+    
+    df = pd.DataFrame(series)
+    df['nama'] = df['user_id'].map(names)
+    fig = px.line(
+        df,
+        x='period',
+        y='score',
+        color='nama',
+        labels={'score': 'Mood', 'period': 'Tanggal', 'count': 'Jumlah entri', 'nama': ''},
+        hover_data=['count'],
+        markers=True,
+        color_discrete_sequence=['#BFA2DB', '#F4A6C6']
+    )
+    return style_mood_figure(fig, theme_mode, legend=dict(orientation="h", y=-0.2))
+
+def render_couple_timeline(couple_id, unit, start_date, end_date):
+    """Both partners' mood lines in one figure, with agreement metrics computed by MongoDB"""
+    user_id = st.session_state.user_id
+    partner_id = "person1" if user_id == "person2" else "person2"
+    names = {user_id: st.session_state.user_name, partner_id: st.session_state.partner_name}
+    theme_mode = st.session_state.theme_mode
+    
+    def load():
+        series, agreement = repos.moods.couple_timeline(couple_id, unit, start_date, end_date)
+        return build_couple_figure(series, names, theme_mode), agreement
+    
+    # Figure dibangun ulang hanya jika mood salah satu dari mereka berubah
+    versions = tuple(mood_data_version(couple_id, member) for member in ("person1", "person2"))
+    fig, agreement = read_cache.get_or_load(
+        "couple_timeline", couple_id, load,
+        params=(versions, theme_mode, names[user_id], names[partner_id], unit, start_date, end_date),
+    )
+    if fig is None:
+        st.info("Tidak ada mood di rentang tanggal ini.")
+        return
+    
+    st.plotly_chart(fig, use_container_width=True)
+    
+    col_shared, col_agree, col_gap = st.columns(3)
+    col_shared.metric("Periode bersama", agreement['shared_periods'])
+    col_agree.metric("Mood selaras", f"{agreement['agreement_rate']:.0%}" if agreement['agreement_rate'] is not None else "-",
+                     help="Periode dengan selisih rata-rata mood paling banyak 1 tingkat")
+    col_gap.metric("Selisih rata-rata", agreement['mean_abs_diff'] if agreement['mean_abs_diff'] is not None else "-")
+
+def render_mood_entry(mood):
+    date_str = parse_timestamp(mood['created_at']).astimezone().strftime("%d %b %Y, %H:%M")
+    st.markdown(f"<p><b>{date_str}</b> - {mood['mood_emoji']} {mood['mood_note']}</p>", unsafe_allow_html=True)
+
 # Mood Tracker page
 def render_mood_tracker():
     st.markdown("<h1 class='main-header'>Mood Tracker</h1>", unsafe_allow_html=True)
     
-    # Mood input card
+    render_mood_input()
+    
+    couple_id = str(st.session_state.couple_id)
+    user_id = st.session_state.user_id
+    
+    # Mood statistics, one point read of the user's stats document
+    try:
+        stats = read_cache.get_or_load("mood_stats", couple_id,
+                                       lambda: repos.mood_stats.summary(couple_id, user_id),
+                                       user_id=user_id)
+        if stats["count"]:
+            render_mood_stats_card(stats, show_distribution=True)
+    except Exception as e:
+        st.error(f"Error fetching mood stats: {str(e)}")
+    
+    # Mood history
+    st.markdown("<div class='card'>", unsafe_allow_html=True)
+    st.markdown("<h3>Riwayat Mood</h3>", unsafe_allow_html=True)
+    
+    try:
+        total_moods = read_cache.get_or_load("mood_count", couple_id,
+                                             lambda: repos.moods.count(couple_id, user_id),
+                                             user_id=user_id)
+        if total_moods:
+            render_mood_chart(couple_id, user_id)
+            render_mood_notes(couple_id, user_id, total_moods)
+        else:
+            st.info("Belum ada riwayat mood. Mulai catat mood harian kamu sekarang!")
+    except Exception as e:
+        st.error(f"Error fetching mood history: {str(e)}")
+    
+    st.markdown("</div>", unsafe_allow_html=True)
+
+# Mood input card: memilih emoji dan mengetik catatan hanya menjalankan ulang kartu ini
+@page_fragment("mood_input")
+def render_mood_input():
     st.markdown("<div class='card'>", unsafe_allow_html=True)
     st.markdown("<h3>Bagaimana perasaanmu hari ini?</h3>", unsafe_allow_html=True)
     
+    # Hasil penyimpanan sebelumnya; menyimpan mood menjalankan ulang seluruh halaman
+    save_result = st.session_state.pop('mood_save_result', None)
+    if save_result == "saved":
+        st.success("Mood berhasil disimpan!")
+    elif save_result == "repeated":
+        st.info("Mood ini sudah tersimpan sebelumnya.")
+    elif save_result == "queued":
+        st.info("Database sedang tidak terjangkau. Mood disimpan di antrean dan dikirim otomatis saat koneksi pulih.")
+    
     # Emoji mood selector
     mood_options = {
         "😍": "Sangat Bahagia",
@@ -453,76 +705,134 @@ def render_mood_tracker():
     if st.button("Simpan Mood"):
         if 'selected_mood' in st.session_state:
             try:
-                db.moods.insert_one({
+                mood_note = mood_note if mood_note else ""
+                mood = {
                     "couple_id": str(st.session_state.couple_id),
                     "user_id": st.session_state.user_id,
                     "mood_emoji": st.session_state.selected_mood,
-                    "mood_note": mood_note if mood_note else "",
-                    "created_at": datetime.now().isoformat()
-                })
-                st.success("Mood berhasil disimpan!")
+                    "mood_note": mood_note,
+                    "created_at": datetime.now(timezone.utc),
+                    "idempotency_key": submission_key("mood", (st.session_state.selected_mood, mood_note)),
+                }
+                save_result = offline.write("moods", mood, repos.moods.add)
+                rotate_submission_key("mood")
+                if save_result != "queued":
+                    # Mood terbaru couple dan semua data riwayat user ini berubah
+                    read_cache.invalidate(mood['couple_id'], "latest_moods", "couple_timeline")
+                    read_cache.invalidate(mood['couple_id'], user_id=mood['user_id'])
+                st.session_state.mood_save_result = save_result
+                # Kembali ke halaman pertama riwayat supaya mood baru terlihat
+                st.session_state.mood_history_cursors = [None]
                 # Clear the selection
                 if 'selected_mood' in st.session_state:
                     del st.session_state.selected_mood
             except Exception as e:
                 st.error(f"Error saving mood: {str(e)}")
+            else:
+                # Statistik, grafik, dan riwayat di luar fragment ini ikut berubah
+                st.rerun()
         else:
             st.warning("Pilih mood terlebih dahulu!")
     
     st.markdown("</div>", unsafe_allow_html=True)
-    
-    # Mood history
-    st.markdown("<div class='card'>", unsafe_allow_html=True)
-    st.markdown("<h3>Riwayat Mood</h3>", unsafe_allow_html=True)
-    
-    # Get mood history
+
+# Mood chart: mengganti granularitas, rentang, atau perbandingan hanya menjalankan ulang grafik
+@page_fragment("mood_chart")
+def render_mood_chart(couple_id, user_id):
     try:
-        moods_cursor = db.moods.find({"couple_id": str(st.session_state.couple_id), "user_id": st.session_state.user_id}).sort("created_at", -1)
-        moods = list(moods_cursor)
-        moods = object_id_to_str(moods)
+        # Pilih granularitas dan rentang tanggal grafik
+        col_unit, col_range = st.columns([1, 2])
+        with col_unit:
+            granularity_label = st.selectbox("Tampilan", list(CHART_GRANULARITIES), key="mood_chart_granularity")
+        with col_range:
+            today = datetime.now().date()
+            date_range = st.date_input("Rentang tanggal", value=(today - timedelta(days=90), today),
+                                       max_value=today, key="mood_chart_range")
         
-        if moods:
-            # Convert to DataFrame
-            df = pd.DataFrame(moods)
-            df['date'] = pd.to_datetime(df['created_at']).dt.date
-            
-            # Plot mood history
-            fig = px.line(
-                df, 
-                x='date', 
-                y=[1 if e == "😍" else 2 if e == "😊" else 3 if e == "😐" else 4 if e == "😔" else 5 for e in df['mood_emoji']],
-                labels={'y': 'Mood', 'date': 'Tanggal'},
-                markers=True,
-                color_discrete_sequence=['#BFA2DB']
+        # date_input mengembalikan satu tanggal selama user masih memilih rentang
+        if isinstance(date_range, (tuple, list)) and len(date_range) == 2:
+            start_date, end_date = date_range
+        else:
+            start_date = end_date = date_range[0] if isinstance(date_range, (tuple, list)) else date_range
+        
+        unit = CHART_GRANULARITIES[granularity_label]
+        partner_name = st.session_state.get('partner_name')
+        if partner_name and st.toggle(f"Bandingkan dengan {partner_name}", key="mood_chart_compare"):
+            render_couple_timeline(couple_id, unit, start_date, end_date)
+        else:
+            # Figure di-cache per versi data user, tema, dan rentang; mood baru menaikkan versinya
+            theme_mode = st.session_state.theme_mode
+            fig = read_cache.get_or_load(
+                "mood_figure", couple_id,
+                lambda: build_mood_figure(
+                    repos.moods.timeseries(couple_id, user_id, unit, start_date, end_date), theme_mode),
+                user_id=user_id,
+                params=(mood_data_version(couple_id, user_id), theme_mode, unit, start_date, end_date),
             )
             
-            # Customize y-axis
-            fig.update_layout(
-                yaxis=dict(
-                    tickvals=[1, 2, 3, 4, 5],
-                    ticktext=["😍", "😊", "😐", "😔", "😢"],
-                    autorange="reversed"
-                ),
-                height=300,
-                margin=dict(l=10, r=10, t=10, b=10)
+            if fig is not None:
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("Tidak ada mood di rentang tanggal ini.")
+    except Exception as e:
+        st.error(f"Error fetching mood chart: {str(e)}")
+
+# Mood notes: pencarian dan pindah halaman hanya menjalankan ulang daftar catatan
+@page_fragment("mood_notes")
+def render_mood_notes(couple_id, user_id, total_moods):
+    try:
+        # Show mood entries, one page at a time
+        st.markdown("<h4>Catatan Mood</h4>", unsafe_allow_html=True)
+        search_query = st.text_input("🔍 Cari catatan mood", key="mood_search",
+                                     placeholder="Kata dalam catatan mood...").strip()
+        
+        if search_query:
+            page = search_page('mood_search', search_query)
+            moods, has_more = read_cache.get_or_load(
+                "mood_search", couple_id,
+                lambda: repos.moods.search(couple_id, user_id, search_query, page, SEARCH_PAGE_SIZE),
+                user_id=user_id, params=(search_query, page),
             )
-            
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Show mood entries
-            st.markdown("<h4>Catatan Mood</h4>", unsafe_allow_html=True)
-            for idx, mood in enumerate(moods[:5]):  # Show only 5 latest entries
-                date_str = datetime.fromisoformat(mood['created_at']).strftime("%d %b %Y, %H:%M")
-                st.markdown(f"<p><b>{date_str}</b> - {mood['mood_emoji']} {mood['mood_note']}</p>", unsafe_allow_html=True)
-            
-            if len(moods) > 5:
-                st.write(f"... dan {len(moods) - 5} entri lainnya")
+            if moods:
+                for mood in moods:
+                    render_mood_entry(mood)
+            else:
+                st.info("Tidak ada catatan yang cocok.")
+            render_search_pager('mood_search', has_more)
         else:
-            st.info("Belum ada riwayat mood. Mulai catat mood harian kamu sekarang!")
+            if 'mood_history_cursors' not in st.session_state:
+                st.session_state.mood_history_cursors = [None]
+            cursors = st.session_state.mood_history_cursors
+
+            moods, next_cursor = read_cache.get_or_load(
+                "mood_page", couple_id,
+                lambda: repos.moods.page(couple_id, user_id, after=cursors[-1], limit=MOOD_HISTORY_PAGE_SIZE),
+                user_id=user_id, params=(cursors[-1],),
+            )
+            for mood in moods:
+                render_mood_entry(mood)
+
+            remaining = total_moods - (len(cursors) - 1) * MOOD_HISTORY_PAGE_SIZE - len(moods)
+            if remaining > 0:
+                st.write(f"... dan {remaining} entri lainnya")
+
+            render_pager('mood_history_cursors', next_cursor)
     except Exception as e:
         st.error(f"Error fetching mood history: {str(e)}")
+
+def quote_entry_html(quote):
+    """HTML for one quote in the collection, rendered as a single markdown element"""
+    quote_html = (
+        f"<div class='quote-box'>\"{quote['quote_text']}\"</div>"
+        f"<p style='text-align: right; font-style: italic;'>— {quote['author']}</p>"
+    )
     
-    st.markdown("</div>", unsafe_allow_html=True)
+    # Show who added the quote
+    added_by_name = st.session_state.user_name if quote['added_by'] == st.session_state.user_id else st.session_state.partner_name
+    if added_by_name:
+        quote_html += f"<p style='text-align: right; font-size: 0.8rem;'>Ditambahkan oleh {added_by_name}</p>"
+    
+    return quote_html + "<hr>"
 
 # Quote collection page
 def render_quotes():
@@ -543,14 +853,29 @@ def render_quotes():
                 st.error("Quote tidak boleh kosong")
             else:
                 try:
-                    db.replies.insert_one({
+                    author = author if author else repository.UNKNOWN_AUTHOR
+                    quote = {
                         "couple_id": str(st.session_state.couple_id),
                         "quote_text": quote_text,
-                        "author": author if author else "Unknown",
+                        "author": author,
                         "added_by": st.session_state.user_id,
-                        "created_at": datetime.now().isoformat()
-                    })
-                    st.success("Quote berhasil disimpan!")
+                        "created_at": datetime.now(timezone.utc),
+                        "idempotency_key": submission_key("quote", (quote_text, author)),
+                    }
+                    # Key tidak dirotasi: form tetap berisi quote yang sama, jadi kirim ulang harus terdeteksi
+                    # sebagai "repeated"; quote berbeda otomatis mendapat key baru dari submission_key()
+                    save_result = offline.write("quotes", quote, repos.quotes.add)
+                    if save_result != "queued":
+                        read_cache.invalidate(str(st.session_state.couple_id), "quote_page", "quote_search", "quote_of_the_day")
+                        # Kembali ke halaman pertama supaya quote baru terlihat
+                        st.session_state.quote_list_cursors = [None]
+                        st.session_state.quote_search_page = 0
+                    if save_result == "saved":
+                        st.success("Quote berhasil disimpan!")
+                    elif save_result == "repeated":
+                        st.info("Quote ini sudah tersimpan sebelumnya.")
+                    else:
+                        st.info("Database sedang tidak terjangkau. Quote disimpan di antrean dan dikirim otomatis saat koneksi pulih.")
                 except Exception as e:
                     st.error(f"Error saving quote: {str(e)}")
     
@@ -559,32 +884,50 @@ def render_quotes():
     # Quote collection
     st.markdown("<div class='card'>", unsafe_allow_html=True)
     st.markdown("<h3>Koleksi Quote</h3>", unsafe_allow_html=True)
-    
-    # Get quotes
+    render_quote_list(str(st.session_state.couple_id))
+    st.markdown("</div>", unsafe_allow_html=True)
+
+# Quote list: pencarian dan pindah halaman hanya menjalankan ulang daftar quote
+@page_fragment("quote_list")
+def render_quote_list(couple_id):
     try:
-        quotes_cursor = db.replies.find({"couple_id": str(st.session_state.couple_id)}).sort("created_at", -1)
-        quotes = list(quotes_cursor)
-        quotes = object_id_to_str(quotes)
+        search_query = st.text_input("🔍 Cari quote", key="quote_search",
+                                     placeholder="Kata dalam quote atau nama penulis...").strip()
         
-        if quotes:
-            # Display quotes
-            for idx, quote in enumerate(quotes):
-                with st.container():
-                    st.markdown(f"<div class='quote-box'>\"{quote['quote_text']}\"</div>", unsafe_allow_html=True)
-                    st.markdown(f"<p style='text-align: right; font-style: italic;'>— {quote['author']}</p>", unsafe_allow_html=True)
-                    
-                    # Show who added the quote
-                    added_by_name = st.session_state.user_name if quote['added_by'] == st.session_state.user_id else st.session_state.partner_name
-                    if added_by_name:
-                        st.markdown(f"<p style='text-align: right; font-size: 0.8rem;'>Ditambahkan oleh {added_by_name}</p>", unsafe_allow_html=True)
-                    
-                    st.markdown("<hr>", unsafe_allow_html=True)
+        if search_query:
+            page = search_page('quote_search', search_query)
+            quotes, has_more = read_cache.get_or_load(
+                "quote_search", couple_id,
+                lambda: repos.quotes.search(couple_id, search_query, page, SEARCH_PAGE_SIZE),
+                params=(search_query, page),
+            )
+            if quotes:
+                for quote in quotes:
+                    st.markdown(quote_entry_html(quote), unsafe_allow_html=True)
+            else:
+                st.info("Tidak ada quote yang cocok.")
+            render_search_pager('quote_search', has_more)
         else:
-            st.info("Belum ada quotes. Tambahkan quote pertama kamu!")
+            if 'quote_list_cursors' not in st.session_state:
+                st.session_state.quote_list_cursors = [None]
+            cursors = st.session_state.quote_list_cursors
+            
+            quotes, next_cursor = read_cache.get_or_load(
+                "quote_page", couple_id,
+                lambda: repos.quotes.page(couple_id, after=cursors[-1], limit=QUOTE_LIST_PAGE_SIZE),
+                params=(cursors[-1],),
+            )
+            
+            if quotes:
+                # Display quotes, satu elemen markdown per quote
+                for quote in quotes:
+                    st.markdown(quote_entry_html(quote), unsafe_allow_html=True)
+                
+                render_pager('quote_list_cursors', next_cursor)
+            else:
+                st.info("Belum ada quotes. Tambahkan quote pertama kamu!")
     except Exception as e:
         st.error(f"Error fetching quotes: {str(e)}")
-    
-    st.markdown("</div>", unsafe_allow_html=True)
 
 # Profile settings page
 def render_profile_settings():
@@ -592,9 +935,12 @@ def render_profile_settings():
     
     # Get couple data
     try:
-        couple = db.couples.find_one({"_id": ObjectId(st.session_state.couple_id)})
+        couple_id = str(st.session_state.couple_id)
+        couple = read_cache.get_or_load(
+            "couple", couple_id,
+            lambda: repos.couples.profile(couple_id),
+        )
         if couple:
-            couple = object_id_to_str(couple)
             
             st.markdown("<div class='card'>", unsafe_allow_html=True)
             
@@ -617,7 +963,7 @@ def render_profile_settings():
                     try:
                         # Prepare update data
                         update_data = {
-                            "updated_at": datetime.now().isoformat()
+                            "updated_at": datetime.now(timezone.utc)
                         }
                         
                         if st.session_state.user_id == "person1":
@@ -626,7 +972,8 @@ def render_profile_settings():
                             update_data["person2_name"] = name
                         
                         # Update database
-                        db.couples.update_one({"_id": ObjectId(st.session_state.couple_id)}, {"$set": update_data})
+                        repos.couples.update_profile(st.session_state.couple_id, update_data)
+                        read_cache.invalidate(couple_id, "couple")
                         
                         # Update session state
                         st.session_state.user_name = name
@@ -651,19 +998,73 @@ def render_profile_settings():
                     st.rerun()
             
             st.markdown("</div>", unsafe_allow_html=True)
+            
+            render_data_transfer(couple_id)
         else:
             st.error("Data couple tidak ditemukan")
     except Exception as e:
         st.error(f"Error fetching couple data: {str(e)}")
 
+# Export and import of moods/quotes
+def render_data_transfer(couple_id):
+    st.markdown("<div class='card'>", unsafe_allow_html=True)
+    st.subheader("Ekspor & Impor Data")
+    
+    col_kind, col_format = st.columns(2)
+    with col_kind:
+        kind = st.selectbox("Data", ["moods", "quotes"], format_func=lambda k: "Mood" if k == "moods" else "Quote",
+                            key="transfer_kind")
+    with col_format:
+        fmt = st.selectbox("Format", list(transfer.FORMATS), key="transfer_format")
+    repo = repos.moods if kind == "moods" else repos.quotes
+    
+    def build_export():
+        # Dijalankan saat tombol diklik; data dibaca dari cursor per batch
+        buffer = io.BytesIO()
+        for line in transfer.export_lines(repo, couple_id, kind, fmt):
+            buffer.write(line.encode("utf-8"))
+        return buffer.getvalue()
+    
+    st.download_button("⬇️ Ekspor", data=build_export, file_name=f"ceritakita-{kind}.{fmt}",
+                       mime="text/csv" if fmt == "csv" else "application/x-ndjson")
+    
+    uploaded = st.file_uploader("Impor dari file", type=["csv", "jsonl", "ndjson", "json"], key="transfer_upload")
+    if uploaded is not None and st.button("📥 Impor", key="transfer_import"):
+        progress_bar = st.progress(0.0, text="Mengimpor...")
+        
+        def report(result):
+            progress_bar.progress(min(1.0, uploaded.tell() / max(uploaded.size, 1)),
+                                  text=f"{result.rows} baris dibaca, {result.inserted} disimpan")
+        
+        try:
+            rows = transfer.read_rows(io.TextIOWrapper(uploaded, encoding="utf-8-sig", newline=""),
+                                      transfer.format_from_filename(uploaded.name))
+            result = transfer.import_rows(repo, couple_id, kind, rows, added_by=st.session_state.user_id,
+                                          progress=report)
+            # Semua data couple ini bisa berubah: riwayat, grafik, quote, mood terbaru
+            read_cache.invalidate(couple_id)
+            for state_key in ("mood_history_cursors", "quote_list_cursors"):
+                st.session_state.pop(state_key, None)
+            st.success(f"Impor selesai: {result.inserted} disimpan, {result.skipped} dilewati")
+            if result.errors:
+                with st.expander("Baris yang dilewati"):
+                    for error in result.errors:
+                        st.write(error)
+        except Exception as e:
+            st.error(f"Error importing data: {str(e)}")
+    
+    st.markdown("</div>", unsafe_allow_html=True)
+
 # Function to test MongoDB connection
 def test_mongodb_connection():
     try:
         # Check server info to test connection
+        client = db.client if backend == "memory" else database.get_client(mongodb_uri, mongodb_options)
         server_info = client.server_info()
         version = server_info.get('version', 'unknown')
         return True, f"Terhubung ke MongoDB (version {version})"
     except Exception as e:
+        # Client dipakai bersama semua sesi; driver menyambung ulang sendiri, jadi jangan ditutup di sini
         return False, f"Gagal terhubung: {str(e)}"
 
 # Function to mask MongoDB URI for security
@@ -710,6 +1111,78 @@ def mask_mongodb_uri(uri):
         # If any error occurs during masking, mask the entire string
         return uri[:10] + '*' * (len(uri) - 15) + uri[-5:] if len(uri) > 20 else '*' * len(uri)
 
+# Sidebar database status: "Test Koneksi" hanya menjalankan ulang bagian ini
+@page_fragment("sidebar_status")
+def render_sidebar_status():
+    st.markdown("<p style='font-size:0.9rem;'>Status Database:</p>", unsafe_allow_html=True)
+    
+    # Display masked MongoDB URI
+    masked_uri = mask_mongodb_uri(mongodb_uri)
+    st.markdown(f"<p style='font-size:0.8rem; word-break: break-all;'><b>URI:</b> {masked_uri}</p>", unsafe_allow_html=True)
+
+    # Status dari heartbeat background driver, tanpa ping tambahan
+    healthy, health_message = database.health_status()
+    health_icon = "🟢" if healthy else "⚪" if healthy is None else "🔴"
+    st.markdown(f"<p style='font-size:0.8rem;'>{health_icon} {health_message}</p>", unsafe_allow_html=True)
+    if offline.outbox is not None and offline.outbox.pending():
+        st.markdown(f"<p style='font-size:0.8rem;'>📤 {offline.outbox.pending()} tulisan menunggu dikirim</p>",
+                    unsafe_allow_html=True)
+    
+    if st.button("🔄 Test Koneksi", key="test_db_connection"):
+        success, message = test_mongodb_connection()
+        if success:
+            st.success(message)
+        else:
+            st.error(message)
+
+    # Statistik cache baca bersama
+    cache_stats = read_cache.stats()
+    st.markdown(
+        f"<p style='font-size:0.8rem;'><b>Cache:</b> {cache_stats['hits']} hit, {cache_stats['misses']} miss "
+        f"({cache_stats['hit_rate']:.0%}), {cache_stats['entries']} entri</p>",
+        unsafe_allow_html=True,
+    )
+
+# Opt-in sidebar panel with per-page render times and query stats
+@page_fragment("performance_panel")
+def render_performance_panel():
+    st.markdown("---")
+    if not st.checkbox("📈 Panel performa", key="show_performance_panel"):
+        return
+
+    # Rerun ini belum selesai, jadi yang tampil adalah query sejauh ini
+    current = metrics.current_rerun().summary()
+    st.markdown(
+        f"<p style='font-size:0.8rem;'><b>Rerun ini:</b> {current['queries']} query, {current['db_ms']} ms di DB, "
+        f"{current['docs']} dokumen, {current['bytes_in'] / 1024:.1f} KB</p>",
+        unsafe_allow_html=True,
+    )
+
+    page_stats = metrics.performance.page_stats()
+    if page_stats:
+        st.dataframe(
+            [
+                {"halaman": page, "rerun": s["reruns"], "p50 ms": s["render_p50_ms"], "p95 ms": s["render_p95_ms"],
+                 "query p95": s["queries_p95"]}
+                for page, s in page_stats.items()
+            ],
+            hide_index=True,
+        )
+
+    slow_queries = metrics.performance.slow_queries()
+    if slow_queries:
+        st.markdown(f"<p style='font-size:0.8rem;'><b>Query lambat (≥ {metrics.performance.slow_query_ms:g} ms):</b></p>",
+                    unsafe_allow_html=True)
+        for query in slow_queries[-5:]:
+            st.markdown(
+                f"<p style='font-size:0.75rem;'>{query['collection']}.{query['command']} "
+                f"{query['duration_ms']:.0f} ms · {query['page']}</p>",
+                unsafe_allow_html=True,
+            )
+
+    st.download_button("⬇️ Ekspor metrik", metrics.performance.export(), file_name="ceritakita-metrics.json",
+                       mime="application/json")
+
 # Main navigation
 def main():
     if not st.session_state.authenticated:
@@ -729,43 +1202,24 @@ def main():
             # Theme toggle in sidebar
             theme_icon = "🌙" if st.session_state.theme_mode == "light" else "☀️"
             theme_text = "Mode Gelap" if st.session_state.theme_mode == "light" else "Mode Terang"
-            if st.button(f"{theme_icon} {theme_text}", key="theme_toggle_sidebar"):
-                toggle_theme()
-                st.rerun()
+            # Callback dijalankan sebelum rerun, jadi satu klik cukup satu rerun
+            st.button(f"{theme_icon} {theme_text}", key="theme_toggle_sidebar", on_click=toggle_theme)
                 
             st.markdown("---")
             
-            if st.button("📊 Dashboard", use_container_width=True):
-                st.session_state.current_page = "dashboard"
-                st.rerun()
-            
-            if st.button("😊 Mood Tracker", use_container_width=True):
-                st.session_state.current_page = "mood_tracker"
-                st.rerun()
-            
-            if st.button("💬 Quotes of Love", use_container_width=True):
-                st.session_state.current_page = "quotes"
-                st.rerun()
-            
-            if st.button("⚙️ Pengaturan Profil", use_container_width=True):
-                st.session_state.current_page = "profile"
-                st.rerun()
+            st.button("📊 Dashboard", use_container_width=True, on_click=go_to_page, args=("dashboard",))
+            st.button("😊 Mood Tracker", use_container_width=True, on_click=go_to_page, args=("mood_tracker",))
+            st.button("💬 Quotes of Love", use_container_width=True, on_click=go_to_page, args=("quotes",))
+            st.button("⚙️ Pengaturan Profil", use_container_width=True, on_click=go_to_page, args=("profile",))
             
             # MongoDB connection status
             st.markdown("---")
-            st.markdown("<p style='font-size:0.9rem;'>Status Database:</p>", unsafe_allow_html=True)
-            
-            # Display masked MongoDB URI
-            masked_uri = mask_mongodb_uri(mongodb_uri)
-            st.markdown(f"<p style='font-size:0.8rem; word-break: break-all;'><b>URI:</b> {masked_uri}</p>", unsafe_allow_html=True)
-            
-            if st.button("🔄 Test Koneksi", key="test_db_connection"):
-                success, message = test_mongodb_connection()
-                if success:
-                    st.success(message)
-                else:
-                    st.error(message)
-        
+            render_sidebar_status()
+
+        if offline.degraded():
+            st.warning("📴 Database sedang tidak terjangkau. Kamu melihat data tersimpan terakhir; "
+                       "mood dan quote baru dikirim otomatis saat koneksi pulih.")
+
         # Render selected page
         if st.session_state.current_page == "dashboard":
             render_dashboard()
@@ -776,5 +1230,11 @@ def main():
         elif st.session_state.current_page == "profile":
             render_profile_settings()
 
+        with st.sidebar:
+            render_performance_panel()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    finally:
+        metrics.end_rerun(rerun_metrics)
\ No newline at end of file
@@ -0,0 +1,257 @@
+# metrics.py - instrumentasi perintah MongoDB dan waktu render per halaman
+
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+import bson
+from pymongo import monitoring
+
+# Perintah yang lebih lama dari ini (ms) dicatat di slow-query log; bisa diubah lewat [metrics]
+SLOW_QUERY_MS = 100
+
+# Jumlah rerun terakhir per halaman yang dipakai untuk p50/p95
+RERUN_SAMPLES_PER_PAGE = 200
+SLOW_QUERY_LOG_SIZE = 50
+
+logger = logging.getLogger("ceritakita.slow_query")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty sequence"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def document_size(doc):
+    """Encoded BSON size of a command or reply; 0 if it can't be encoded"""
+    raw = getattr(doc, "raw", None)
+    if raw is not None:
+        return len(raw)
+    try:
+        return len(bson.encode(doc))
+    except Exception:
+        return 0
+
+
+def returned_documents(reply):
+    """Number of documents a command returned (cursor batch or write count)"""
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+    n = reply.get("n")
+    return n if isinstance(n, int) else 0
+
+
+class RerunMetrics:
+    """Commands issued during one script rerun, tagged with the page being rendered
+
+    `page` is "<page>/<fragment>" for a rerun of a single st.fragment. Command and reply
+    sizes are only measured with `measure_bytes`, since that re-encodes every document.
+    """
+
+    def __init__(self, page, measure_bytes=False):
+        self.page = page
+        self.measure_bytes = measure_bytes
+        self.started_at = time.perf_counter()
+        self.render_ms = None
+        self.token = None
+        self.commands = []
+        self.fragments = {}
+        self._lock = threading.Lock()
+
+    def add(self, command):
+        with self._lock:
+            self.commands.append(command)
+
+    @contextlib.contextmanager
+    def fragment(self, name):
+        """Time a fragment rendered as part of this rerun"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.fragments[name] = round((time.perf_counter() - started) * 1000, 2)
+
+    def summary(self):
+        with self._lock:
+            commands = list(self.commands)
+        return {
+            "page": self.page,
+            "render_ms": self.render_ms,
+            "queries": len(commands),
+            "db_ms": round(sum(c["duration_ms"] for c in commands), 2),
+            "docs": sum(c["docs"] for c in commands),
+            "bytes_measured": self.measure_bytes,
+            "bytes_in": sum(c["bytes_in"] for c in commands),
+            "bytes_out": sum(c["bytes_out"] for c in commands),
+            "fragments": dict(self.fragments),
+        }
+
+
+# Rerun yang sedang berjalan di thread/konteks ini
+_current_rerun = contextvars.ContextVar("ceritakita_rerun", default=None)
+
+
+class PerformanceStore:
+    """Process-wide rolling window of rerun summaries per page plus the slow-query log"""
+
+    def __init__(self, samples_per_page=RERUN_SAMPLES_PER_PAGE, slow_query_ms=SLOW_QUERY_MS):
+        self.samples_per_page = samples_per_page
+        self.slow_query_ms = slow_query_ms
+        # Ukur byte setiap perintah di semua sesi, bukan hanya rerun dengan panel performa terbuka
+        self.measure_bytes = False
+        self._lock = threading.Lock()
+        self._reruns = {}
+        self._slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+    def record_rerun(self, summary):
+        with self._lock:
+            samples = self._reruns.setdefault(summary["page"], deque(maxlen=self.samples_per_page))
+            samples.append(summary)
+
+    def record_command(self, command):
+        if command["duration_ms"] < self.slow_query_ms:
+            return
+        logger.warning("slow query %s.%s %.1f ms (%s docs, page %s)", command["collection"], command["command"],
+                       command["duration_ms"], command["docs"], command["page"])
+        with self._lock:
+            self._slow_queries.append(command)
+
+    def page_stats(self):
+        """Return {page: {reruns, render_p50_ms, render_p95_ms, queries_p50, queries_p95, ...}}
+
+        fragment_p50_ms holds, per fragment, its p50 time inside the page's full reruns.
+        bytes_in_avg only counts reruns whose bytes were measured (None without any).
+        """
+        with self._lock:
+            reruns = {page: list(samples) for page, samples in self._reruns.items()}
+
+        stats = {}
+        for page, samples in reruns.items():
+            render_ms = [s["render_ms"] for s in samples]
+            queries = [s["queries"] for s in samples]
+            measured = [s["bytes_in"] for s in samples if s.get("bytes_measured")]
+            fragments = {}
+            for s in samples:
+                for name, ms in s.get("fragments", {}).items():
+                    fragments.setdefault(name, []).append(ms)
+            stats[page] = {
+                "reruns": len(samples),
+                "render_p50_ms": percentile(render_ms, 50),
+                "render_p95_ms": percentile(render_ms, 95),
+                "queries_p50": percentile(queries, 50),
+                "queries_p95": percentile(queries, 95),
+                "db_ms_p95": percentile([s["db_ms"] for s in samples], 95),
+                "bytes_in_avg": round(sum(measured) / len(measured)) if measured else None,
+                "fragment_p50_ms": {name: percentile(values, 50) for name, values in fragments.items()},
+            }
+        return stats
+
+    def slow_queries(self):
+        with self._lock:
+            return list(self._slow_queries)
+
+    def export(self):
+        """All metrics as a JSON string for download"""
+        return json.dumps({"pages": self.page_stats(), "slow_queries": self.slow_queries()}, indent=2, default=str)
+
+    def clear(self):
+        with self._lock:
+            self._reruns.clear()
+            self._slow_queries.clear()
+
+
+class CommandRecorder(monitoring.CommandListener):
+    """Time every MongoDB command and attribute it to the rerun that issued it
+
+    The driver publishes command events on the thread that runs the command, so the
+    context variable set by begin_rerun() identifies the page. Count and duration are
+    always recorded; sizes only when the rerun or the store asks for them.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def started(self, event):
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        else:
+            collection = event.command.get(event.command_name)
+        rerun = _current_rerun.get()
+        measure_bytes = self.store.measure_bytes or (rerun is not None and rerun.measure_bytes)
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = (
+                rerun,
+                collection if isinstance(collection, str) else None,
+                document_size(event.command) if measure_bytes else 0,
+                measure_bytes,
+            )
+
+    def succeeded(self, event):
+        self._finish(event, event.reply, True)
+
+    def failed(self, event):
+        self._finish(event, None, False)
+
+    def _finish(self, event, reply, ok):
+        with self._lock:
+            pending = self._pending.pop((event.request_id, event.connection_id), None)
+        if pending is None:
+            return
+        rerun, collection, bytes_out, measure_bytes = pending
+        docs = returned_documents(reply) if reply is not None else 0
+        bytes_in = document_size(reply) if reply is not None and measure_bytes else 0
+
+        command = {
+            "page": rerun.page if rerun else None,
+            "command": event.command_name,
+            "collection": collection,
+            "duration_ms": event.duration_micros / 1000,
+            "docs": docs,
+            "bytes_in": bytes_in,
+            "bytes_out": bytes_out,
+            "ok": ok,
+        }
+        if rerun is not None:
+            rerun.add(command)
+        self.store.record_command(command)
+
+
+# Satu store dan satu listener untuk seluruh proses
+performance = PerformanceStore()
+command_recorder = CommandRecorder(performance)
+
+
+def begin_rerun(page, measure_bytes=False):
+    """Start collecting metrics for the current rerun; pass the result to end_rerun()"""
+    rerun = RerunMetrics(page, measure_bytes)
+    rerun.token = _current_rerun.set(rerun)
+    return rerun
+
+
+def end_rerun(rerun):
+    rerun.render_ms = round((time.perf_counter() - rerun.started_at) * 1000, 2)
+    _current_rerun.reset(rerun.token)
+    performance.record_rerun(rerun.summary())
+    return rerun
+
+
+def current_rerun():
+    return _current_rerun.get()
+
+
+def configure_from_secrets(metrics_secrets):
+    """Apply the optional [metrics] secrets section: slow_query_ms, measure_bytes"""
+    if "slow_query_ms" in metrics_secrets:
+        performance.slow_query_ms = float(metrics_secrets["slow_query_ms"])
+    if "measure_bytes" in metrics_secrets:
+        performance.measure_bytes = bool(metrics_secrets["measure_bytes"])
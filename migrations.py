@@ -0,0 +1,532 @@
+# migrations.py - versi skema dan index untuk database CeritaKita
+
+import argparse
+import logging
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, UpdateOne
+
+import database
+import repository
+
+logger = logging.getLogger("ceritakita.migrations")
+
+# Koleksi yang mencatat migrasi yang sudah dijalankan
+MIGRATIONS_COLLECTION = "schema_migrations"
+
+# Daftar migrasi terurut: (version, name, function, background)
+MIGRATIONS = []
+
+# Tulisan dengan isi sama dalam jendela ini dianggap satu kiriman yang terulang (klik ganda, retry)
+DEDUPE_WINDOW_SECONDS = 60
+MOOD_DEDUPE_FIELDS = ("mood_emoji", "mood_note")
+QUOTE_DEDUPE_FIELDS = ("quote_text", "author", "added_by")
+
+# Jeda sebelum ensure_migrated mencoba lagi setelah gagal; berlipat dua setiap kegagalan
+RETRY_BACKOFF_SECONDS = 5
+MAX_RETRY_BACKOFF_SECONDS = 300
+
+
+class MigrationError(Exception):
+    """A migration that cannot finish until the data is fixed by hand"""
+
+
+def migration(version, name, background=False):
+    """Register a migration; every migration must be safe to run more than once
+
+    Background migrations (backfills that read or rewrite whole collections) are not run
+    while the app starts; ensure_migrated() hands them to a thread, and `migrations.py
+    migrate` runs them in the foreground. Readers must cope with data they have not
+    reached yet.
+    """
+    def decorator(func):
+        MIGRATIONS.append((version, name, func, background))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return decorator
+
+
+@migration(1, "create_core_indexes")
+def create_core_indexes(db):
+    # Login mencari couple berdasarkan kode; unique juga mencegah couple ganda.
+    # Couple ganda dari sebelum index ini ada membuat index gagal dibuat, jadi laporkan dulu
+    duplicates = [doc["_id"] for doc in db.couples.aggregate([
+        {"$group": {"_id": "$couple_code", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": 10},
+    ])]
+    if duplicates:
+        raise MigrationError(
+            f"couple_code dipakai lebih dari satu couple: {', '.join(map(str, duplicates))}. "
+            "Gabungkan atau ganti kode couple tersebut, lalu jalankan `python migrations.py migrate`."
+        )
+    db.couples.create_index([("couple_code", ASCENDING)], unique=True, name="couple_code_unique")
+    # Mood terbaru dan riwayat mood per user
+    db.moods.create_index(
+        [("couple_id", ASCENDING), ("user_id", ASCENDING), ("created_at", DESCENDING)],
+        name="couple_user_created",
+    )
+    # Koleksi quote per couple, terbaru dulu
+    db.replies.create_index(
+        [("couple_id", ASCENDING), ("created_at", DESCENDING)],
+        name="couple_created",
+    )
+
+
+@migration(2, "mood_history_keyset_index")
+def mood_history_keyset_index(db):
+    # Riwayat mood dipaginasi dengan (created_at, _id), jadi _id ikut di index
+    db.moods.create_index(
+        [("couple_id", ASCENDING), ("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+        name="couple_user_created_id",
+    )
+    drop_index_if_exists(db.moods, "couple_user_created")
+
+
+@migration(3, "backfill_latest_moods", background=True)
+def backfill_latest_moods(db):
+    # Dashboard membaca mood terbaru dari couples.latest_moods, isi untuk data lama
+    # (CouplesRepo.latest_moods mengisi couple yang belum sampai ke sini saat dibaca)
+    pipeline = [
+        {"$sort": {"couple_id": 1, "user_id": 1, "created_at": -1}},
+        {"$group": {
+            "_id": {"couple_id": "$couple_id", "user_id": "$user_id"},
+            "mood_emoji": {"$first": "$mood_emoji"},
+            "mood_note": {"$first": "$mood_note"},
+            "created_at": {"$first": "$created_at"},
+        }},
+    ]
+    latest_by_couple = {}
+    for row in db.moods.aggregate(pipeline, allowDiskUse=True):
+        key = row.pop("_id")
+        latest_by_couple.setdefault(key["couple_id"], {})[key["user_id"]] = row
+
+    for couple_id, latest_moods in latest_by_couple.items():
+        if ObjectId.is_valid(couple_id):
+            db.couples.update_one(
+                {"_id": ObjectId(couple_id), "latest_moods": {"$exists": False}},
+                {"$set": {"latest_moods": latest_moods}},
+            )
+
+    db.couples.update_many({"latest_moods": {"$exists": False}}, {"$set": {"latest_moods": {}}})
+
+
+# Field waktu yang dulu disimpan sebagai ISO string, per koleksi
+TIMESTAMP_FIELDS = {
+    "couples": ("created_at", "updated_at", "latest_moods.person1.created_at", "latest_moods.person2.created_at"),
+    "moods": ("created_at",),
+    "replies": ("created_at",),
+    MIGRATIONS_COLLECTION: ("applied_at",),
+}
+
+
+@migration(4, "backfill_bson_timestamps", background=True)
+def backfill_bson_timestamps(db):
+    # Pembaca menerima ISO string maupun datetime selama backfill berjalan
+    backfill_timestamps(db)
+
+
+def backfill_timestamps(db, batch_size=1000, progress=None):
+    """Convert legacy ISO-string timestamps to BSON datetimes in batches
+
+    Only documents whose field is still a string are selected, so the job can be stopped
+    and restarted at any point. Naive strings are read as the local time of the machine
+    running the backfill, which is how the app wrote them.
+    """
+    converted = 0
+    for collection_name, fields in TIMESTAMP_FIELDS.items():
+        collection = db[collection_name]
+        for field in fields:
+            last_id = None
+            while True:
+                query = {field: {"$type": "string"}}
+                if last_id is not None:
+                    query["_id"] = {"$gt": last_id}
+                batch = list(collection.find(query, {field: 1}).sort("_id", 1).limit(batch_size))
+                if not batch:
+                    break
+                last_id = batch[-1]["_id"]
+
+                requests = []
+                for doc in batch:
+                    value = get_path(doc, field)
+                    try:
+                        parsed = datetime.fromisoformat(value)
+                    except ValueError:
+                        # Biarkan nilai yang tidak bisa dibaca; pembaca tetap menerima string
+                        continue
+                    if parsed.tzinfo is None:
+                        parsed = parsed.astimezone()
+                    # Filter nilai lama supaya update bersamaan dari aplikasi tidak tertimpa
+                    requests.append(UpdateOne(
+                        {"_id": doc["_id"], field: value},
+                        {"$set": {field: parsed.astimezone(timezone.utc)}},
+                    ))
+
+                if requests:
+                    converted += collection.bulk_write(requests, ordered=False).modified_count
+                if progress:
+                    progress(collection_name, field, converted)
+    return converted
+
+
+@migration(5, "quote_list_keyset_index")
+def quote_list_keyset_index(db):
+    # Koleksi quote dipaginasi dengan (created_at, _id), jadi _id ikut di index
+    db.replies.create_index(
+        [("couple_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+        name="couple_created_id",
+    )
+    drop_index_if_exists(db.replies, "couple_created")
+
+
+@migration(6, "text_search_indexes")
+def text_search_indexes(db):
+    # Prefix couple_id (dan user_id) membatasi pencarian ke data milik couple itu saja.
+    # default_language "none": isi kebanyakan berbahasa Indonesia, jadi tanpa stemming/stop word
+    db.replies.create_index(
+        [("couple_id", ASCENDING), ("quote_text", TEXT), ("author", TEXT)],
+        weights={"quote_text": 3, "author": 1},
+        default_language="none",
+        name="couple_quote_text",
+    )
+    db.moods.create_index(
+        [("couple_id", ASCENDING), ("user_id", ASCENDING), ("mood_note", TEXT)],
+        default_language="none",
+        name="couple_user_mood_note_text",
+    )
+
+
+@migration(7, "build_mood_stats", background=True)
+def build_mood_stats(db):
+    # Statistik mood per user diperbarui saat mood disimpan; isi dulu untuk data lama
+    repository.MoodStatsRepo(db).rebuild_all(repository.MoodsRepo(db, None, None).iter_by_user())
+
+
+@migration(8, "mood_bucket_indexes")
+def mood_bucket_indexes(db):
+    # Mode penyimpanan "bucket": upsert mencari bucket bulan ini yang masih punya tempat,
+    # pembaca mengurutkan bucket per user dari yang terbaru
+    buckets = db[repository.BUCKET_COLLECTION]
+    buckets.create_index(
+        [("couple_id", ASCENDING), ("user_id", ASCENDING), ("month", ASCENDING), ("count", ASCENDING)],
+        name="couple_user_month_count",
+    )
+    buckets.create_index(
+        [("couple_id", ASCENDING), ("user_id", ASCENDING), ("last_created_at", DESCENDING)],
+        name="couple_user_last_created",
+    )
+
+
+@migration(9, "idempotency_key_indexes")
+def idempotency_key_indexes(db):
+    # Setiap kiriman dari form membawa idempotency_key; kiriman yang terulang ditolak index ini.
+    # Data lama tanpa key tidak ikut di index
+    for collection in (db.moods, db.replies):
+        collection.create_index(
+            [("couple_id", ASCENDING), ("idempotency_key", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"idempotency_key": {"$exists": True}},
+            name="couple_idempotency_key_unique",
+        )
+
+    # Di bucket setiap mood punya key; mood lama memakai _id-nya supaya index unik bisa dibuat
+    buckets = db[repository.BUCKET_COLLECTION]
+    for bucket in buckets.find({"moods": {"$elemMatch": {"idempotency_key": {"$exists": False}}}},
+                               {"moods._id": 1, "moods.idempotency_key": 1}):
+        missing = {f"moods.{i}.idempotency_key": str(mood["_id"])
+                   for i, mood in enumerate(bucket["moods"]) if "idempotency_key" not in mood}
+        # Mood baru hanya ditambahkan di akhir array, jadi posisi di atas tetap benar
+        buckets.update_one({"_id": bucket["_id"]}, {"$set": missing})
+    buckets.create_index(
+        [("couple_id", ASCENDING), ("moods.idempotency_key", ASCENDING)],
+        unique=True,
+        name="couple_mood_idempotency_key_unique",
+    )
+
+
+@migration(10, "mood_bucket_id_index")
+def mood_bucket_id_index(db):
+    # Konversi ke bucket dan penghapusan duplikat mencari mood di dalam bucket lewat _id-nya
+    db[repository.BUCKET_COLLECTION].create_index([("moods._id", ASCENDING)], name="moods_id")
+
+
+@migration(11, "quote_random_index")
+def quote_random_index(db):
+    # Quote acak di dashboard dibaca dari titik acak di index ini, bukan $sample atas semua quote couple
+    db.replies.create_index([("couple_id", ASCENDING), ("rand", ASCENDING)], name="couple_rand")
+
+
+@migration(12, "backfill_quote_rand", background=True)
+def backfill_quote_rand(db, batch_size=1000):
+    # Quote lama tanpa rand tidak terpilih oleh index di atas; QuotesRepo.sample memakai $sample sampai semua terisi
+    while True:
+        batch = [doc["_id"] for doc in db.replies.find({"rand": {"$exists": False}}, {"_id": 1}).limit(batch_size)]
+        if not batch:
+            break
+        db.replies.bulk_write([UpdateOne({"_id": quote_id, "rand": {"$exists": False}},
+                                         {"$set": {"rand": random.random()}}) for quote_id in batch],
+                              ordered=False)
+
+
+@migration(13, "mood_bucket_first_created_index")
+def mood_bucket_first_created_index(db):
+    # iter_by_user (dedupe, rebuild statistik) mengurutkan bucket per user dari yang terlama:
+    # sort (couple_id -1, user_id -1, first_created_at 1) adalah index ini dibaca terbalik
+    db[repository.BUCKET_COLLECTION].create_index(
+        [("couple_id", ASCENDING), ("user_id", ASCENDING), ("first_created_at", DESCENDING)],
+        name="couple_user_first_created",
+    )
+
+
+def convert_moods_to_buckets(db, batch_size=1000, progress=None):
+    """Move flat mood documents into monthly buckets, batch by batch
+
+    Each batch is appended to buckets and then deleted from `moods`. Moods already present
+    in a bucket (from an interrupted run) are not appended again, so the job can be
+    stopped and restarted at any point. Returns the number of moods moved.
+    """
+    mood_bucket_indexes(db)
+    mood_bucket_id_index(db)
+    mood_bucket_first_created_index(db)
+    buckets = db[repository.BUCKET_COLLECTION]
+    moved = 0
+    while True:
+        batch = list(db.moods.find({}, {"couple_id": 1, "user_id": 1, "mood_emoji": 1, "mood_note": 1, "created_at": 1,
+                                        "idempotency_key": 1})
+                     .sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        ids = [mood["_id"] for mood in batch]
+        already = {mood["_id"] for bucket in buckets.find({"moods._id": {"$in": ids}}, {"moods._id": 1})
+                   for mood in bucket["moods"]}
+
+        pending = [mood for mood in batch if mood["_id"] not in already]
+        requests = [UpdateOne(*repository.bucket_update(chunk[0]["couple_id"], chunk[0]["user_id"], chunk), upsert=True)
+                    for chunk in repository.bucket_chunks(pending)]
+        if requests:
+            buckets.bulk_write(requests, ordered=False)
+        # Hapus hanya setelah semua mood batch ini ada di bucket
+        db.moods.delete_many({"_id": {"$in": ids}})
+        moved += len(batch)
+        if progress:
+            progress(moved)
+    return moved
+
+
+def duplicate_ids(docs, group_fields, content_fields, window_seconds=DEDUPE_WINDOW_SECONDS):
+    """Yield the _id of every doc that repeats a kept doc of its group within the window
+
+    Docs must arrive grouped by `group_fields`, oldest first within a group. A doc with a
+    client idempotency_key is already guarded by the unique index and is always kept.
+    """
+    window = timedelta(seconds=window_seconds)
+    for _, group in groupby(docs, key=lambda doc: tuple(doc[field] for field in group_fields)):
+        kept = {}
+        for doc in group:
+            created_at = repository.parse_timestamp(doc["created_at"])
+            content = tuple(doc.get(field) for field in content_fields)
+            previous = kept.get(content)
+            # Mood di bucket tanpa key dari client memakai _id-nya sebagai key
+            client_key = doc.get("idempotency_key") not in (None, str(doc["_id"]))
+            if previous is not None and created_at - previous <= window and not client_key:
+                yield doc["_id"]
+            else:
+                kept[content] = created_at
+
+
+def dedupe_writes(db, mood_storage="flat", window_seconds=DEDUPE_WINDOW_SECONDS, batch_size=1000,
+                  dry_run=False, progress=None):
+    """Collapse moods and quotes saved more than once before idempotency keys existed
+
+    The oldest copy is kept; later copies with the same content from the same user within
+    `window_seconds` are deleted in batches. Mood stats are rebuilt afterwards when moods
+    were removed. Returns {"moods": n, "replies": n}; with `dry_run` nothing is deleted.
+    """
+    repos = repository.create_repositories(db, mood_storage=mood_storage)
+    projection = {"couple_id": 1, "user_id": 1, "mood_emoji": 1, "mood_note": 1, "created_at": 1, "idempotency_key": 1}
+    sources = {
+        "moods": (duplicate_ids(repos.moods.iter_by_user(batch_size, projection), ("couple_id", "user_id"),
+                                MOOD_DEDUPE_FIELDS, window_seconds),
+                  repos.moods.remove),
+        "replies": (duplicate_ids(db.replies.find({}, {"couple_id": 1, "created_at": 1, "idempotency_key": 1,
+                                                       **{field: 1 for field in QUOTE_DEDUPE_FIELDS}})
+                                  .sort([("couple_id", -1), ("created_at", 1), ("_id", 1)])
+                                  .batch_size(batch_size),
+                                  ("couple_id",), QUOTE_DEDUPE_FIELDS, window_seconds),
+                    lambda ids: db.replies.delete_many({"_id": {"$in": ids}}).deleted_count),
+    }
+
+    removed = {}
+
+    def flush(name, remove, batch):
+        removed[name] += len(batch) if dry_run else remove(batch)
+        batch.clear()
+        if progress:
+            progress(name, removed[name])
+
+    for name, (ids, remove) in sources.items():
+        removed[name] = 0
+        batch = []
+        for doc_id in ids:
+            batch.append(doc_id)
+            if len(batch) >= batch_size:
+                flush(name, remove, batch)
+        if batch:
+            flush(name, remove, batch)
+
+    if removed["moods"] and not dry_run:
+        repos.mood_stats.rebuild_all(repos.moods.iter_by_user(batch_size=batch_size))
+    return removed
+
+
+def get_path(doc, path):
+    for part in path.split("."):
+        doc = doc[part]
+    return doc
+
+
+def drop_index_if_exists(collection, name):
+    if name in collection.index_information():
+        collection.drop_index(name)
+
+
+def applied_versions(db):
+    """Return the set of migration versions already recorded in the database"""
+    return {doc["_id"] for doc in db[MIGRATIONS_COLLECTION].find({}, {"_id": 1})}
+
+
+def run_migrations(db, background=None):
+    """Apply pending migrations in order and return the names that were applied
+
+    `background` True or False limits the run to background or startup migrations.
+    """
+    done = applied_versions(db)
+    applied = []
+
+    for version, name, func, is_background in MIGRATIONS:
+        if version in done or (background is not None and is_background != background):
+            continue
+
+        func(db)
+        db[MIGRATIONS_COLLECTION].update_one(
+            {"_id": version},
+            {"$set": {"name": name, "applied_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        applied.append(name)
+
+    return applied
+
+
+_lock = threading.Lock()
+_migrated = False
+# (waktu gagal, error, jumlah kegagalan berturut-turut) dari percobaan terakhir
+_last_failure = None
+
+
+def run_background_migrations(db):
+    """Apply pending background migrations, retrying with backoff until they succeed"""
+    failures = 0
+    while True:
+        try:
+            for name in run_migrations(db, background=True):
+                logger.info("migrasi latar belakang %s selesai", name)
+            return
+        except Exception as e:
+            failures += 1
+            backoff = min(RETRY_BACKOFF_SECONDS * 2 ** (failures - 1), MAX_RETRY_BACKOFF_SECONDS)
+            logger.warning("migrasi latar belakang gagal, dicoba lagi dalam %s detik: %s", backoff, e)
+            time.sleep(backoff)
+
+
+def ensure_migrated(db):
+    """Run the startup migrations until they succeed once per process; later calls are no-ops
+
+    After a failure the error is raised again without retrying until a backoff (doubling
+    up to MAX_RETRY_BACKOFF_SECONDS) has passed, so a broken migration is not retried on
+    every rerun but is not given up on either. Once they succeed, background migrations
+    start in their own thread, outside the lock, so no session waits for them.
+    """
+    global _migrated, _last_failure
+
+    if _migrated:
+        return []
+
+    with _lock:
+        if _migrated:
+            return []
+        if _last_failure is not None:
+            failed_at, error, failures = _last_failure
+            backoff = min(RETRY_BACKOFF_SECONDS * 2 ** (failures - 1), MAX_RETRY_BACKOFF_SECONDS)
+            if time.monotonic() - failed_at < backoff:
+                raise error
+        try:
+            applied = run_migrations(db, background=False)
+        except Exception as e:
+            failures = _last_failure[2] + 1 if _last_failure is not None else 1
+            _last_failure = (time.monotonic(), e, failures)
+            raise
+        _migrated = True
+        _last_failure = None
+    threading.Thread(target=run_background_migrations, args=(db,), name="ceritakita-migrations", daemon=True).start()
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrasi database CeritaKita")
+    parser.add_argument("command", choices=["migrate", "backfill-timestamps", "rebuild-mood-stats",
+                                            "convert-mood-buckets", "dedupe"])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--window", type=int, default=DEDUPE_WINDOW_SECONDS,
+                        help="dedupe: jarak maksimum (detik) antara tulisan yang dianggap duplikat")
+    parser.add_argument("--dry-run", action="store_true", help="dedupe: hanya hitung, tanpa menghapus")
+    args = parser.parse_args()
+
+    secrets = database.load_local_secrets()
+    mongo_secrets = secrets["mongodb"]
+    db = database.get_database(mongo_secrets["uri"], database.load_client_options(mongo_secrets))
+
+    if args.command == "migrate":
+        try:
+            for name in run_migrations(db):
+                print(f"applied {name}")
+        except MigrationError as e:
+            sys.exit(str(e))
+    elif args.command == "rebuild-mood-stats":
+        repos = repository.create_repositories(db, mood_storage=repository.get_mood_storage(secrets.get("moods")))
+        rebuilt = repos.mood_stats.rebuild_all(
+            repos.moods.iter_by_user(batch_size=args.batch_size),
+            progress=lambda total: print(f"{total} statistik user dibangun ulang") if total % 100 == 0 else None,
+        )
+        print(f"selesai, {rebuilt} statistik user dibangun ulang")
+    elif args.command == "convert-mood-buckets":
+        moved = convert_moods_to_buckets(
+            db, batch_size=args.batch_size,
+            progress=lambda total: print(f"{total} mood dipindahkan ke bucket"),
+        )
+        print(f"selesai, {moved} mood dipindahkan; set [moods] storage = \"bucket\" di secrets.toml")
+    elif args.command == "dedupe":
+        removed = dedupe_writes(
+            db, mood_storage=repository.get_mood_storage(secrets.get("moods")), window_seconds=args.window,
+            batch_size=args.batch_size, dry_run=args.dry_run,
+            progress=lambda collection, total: print(f"{collection}: {total} duplikat"),
+        )
+        verb = "ditemukan" if args.dry_run else "dihapus"
+        print(f"selesai, {removed['moods']} mood dan {removed['replies']} quote duplikat {verb}")
+    else:
+        converted = backfill_timestamps(
+            db, batch_size=args.batch_size,
+            progress=lambda collection, field, total: print(f"{collection}.{field}: {total} dokumen dikonversi"),
+        )
+        print(f"selesai, {converted} dokumen dikonversi")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+# offline.py - mode baca-saja saat MongoDB tidak terjangkau: circuit breaker, snapshot SQLite, dan antrean tulis
+
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from bson.objectid import ObjectId
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, PyMongoError
+
+from cache import read_cache
+
+# Gagal berturut-turut sebelum breaker terbuka, dan jeda sebelum mencoba MongoDB lagi (detik)
+FAILURE_THRESHOLD = 3
+RESET_SECONDS = 30
+
+# File SQLite lokal untuk snapshot baca dan antrean tulis; bisa diubah lewat [offline]
+SNAPSHOT_PATH = ".streamlit/ceritakita_offline.sqlite3"
+SNAPSHOT_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+SNAPSHOT_MAX_ENTRIES = 20000
+# Snapshot lama dibersihkan setiap sekian penyimpanan
+SNAPSHOT_PRUNE_EVERY = 500
+
+# Tulisan yang terus gagal (bukan karena koneksi) ditandai gagal setelah sekian percobaan
+OUTBOX_MAX_ATTEMPTS = 5
+
+logger = logging.getLogger("ceritakita.offline")
+
+
+class CircuitOpen(ConnectionFailure):
+    """MongoDB is marked unreachable, so the call was not attempted"""
+
+
+def is_connection_error(error):
+    """True for errors that mean MongoDB could not be reached, as opposed to a rejected request"""
+    if isinstance(error, ConnectionFailure):
+        return True
+    # Timeout driver (CSOT, maxTimeMS) juga berarti server tidak menjawab tepat waktu
+    return isinstance(error, PyMongoError) and error.timeout
+
+
+class CircuitBreaker:
+    """Stop calling MongoDB after consecutive connection failures
+
+    Closed: calls go through. After `failure_threshold` consecutive connection errors
+    the breaker opens and calls fail fast with CircuitOpen. Once `reset_seconds` have
+    passed and `health_check()` (the driver heartbeats) is not False, one call is let
+    through as a probe; its success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_seconds=RESET_SECONDS, health_check=None):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.health_check = health_check
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self._probing or time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            if self.health_check is not None and self.health_check() is False:
+                return False
+            self.state = "half_open"
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("MongoDB terjangkau lagi, breaker ditutup")
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state == "closed":
+                    logger.warning("MongoDB tidak terjangkau, breaker dibuka: %s", error)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def trip(self, error):
+        """Open the breaker right away, e.g. when the first ping at startup fails"""
+        with self._lock:
+            self.failures = max(self.failures, self.failure_threshold)
+        self.record_failure(error)
+
+    def call(self, func):
+        if not self.allow():
+            raise CircuitOpen(f"database tidak terjangkau ({self.last_error})")
+        try:
+            value = func()
+        except Exception as e:
+            if is_connection_error(e):
+                self.record_failure(e)
+            else:
+                # Server menjawab, walaupun menolak permintaannya
+                self.record_success()
+            raise
+        self.record_success()
+        return value
+
+
+def _connect(path, synchronous):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+    return conn
+
+
+class SnapshotStore:
+    """Last successful result of every read-cache key, pickled into SQLite"""
+
+    def __init__(self, path=SNAPSHOT_PATH, max_age=SNAPSHOT_MAX_AGE_SECONDS, max_entries=SNAPSHOT_MAX_ENTRIES):
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._saves = 0
+        # Snapshot boleh hilang saat crash, jadi tidak perlu fsync di setiap simpan
+        self._conn = _connect(path, "NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS snapshots "
+                           "(key TEXT PRIMARY KEY, value BLOB NOT NULL, saved_at REAL NOT NULL)")
+
+    def save(self, key, value):
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.debug("snapshot %r tidak bisa disimpan: %s", key, e)
+            return
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO snapshots (key, value, saved_at) VALUES (?, ?, ?)",
+                               (repr(key), payload, time.time()))
+            self._saves += 1
+            if self._saves % SNAPSHOT_PRUNE_EVERY == 0:
+                self._prune()
+
+    def get(self, key):
+        """Return (value, saved_at) for the key, or None if there is no snapshot young enough"""
+        with self._lock:
+            row = self._conn.execute("SELECT value, saved_at FROM snapshots WHERE key = ? AND saved_at > ?",
+                                     (repr(key), time.time() - self.max_age)).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(row[0]), row[1]
+
+    def _prune(self):
+        self._conn.execute("DELETE FROM snapshots WHERE saved_at <= ?", (time.time() - self.max_age,))
+        self._conn.execute("DELETE FROM snapshots WHERE key NOT IN "
+                           "(SELECT key FROM snapshots ORDER BY saved_at DESC LIMIT ?)", (self.max_entries,))
+
+
+class WriteOutbox:
+    """Durable FIFO of mood/quote writes made while MongoDB was unreachable"""
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Antrean tulis harus selamat dari crash, jadi setiap enqueue di-fsync
+        self._conn = _connect(path, "FULL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                           "kind TEXT NOT NULL, payload BLOB NOT NULL, queued_at REAL NOT NULL, "
+                           "attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, failed INTEGER NOT NULL DEFAULT 0)")
+        self._pending = self._conn.execute("SELECT COUNT(*) FROM outbox WHERE failed = 0").fetchone()[0]
+
+    def pending(self):
+        return self._pending
+
+    def enqueue(self, kind, doc):
+        with self._lock:
+            self._conn.execute("INSERT INTO outbox (kind, payload, queued_at) VALUES (?, ?, ?)",
+                               (kind, pickle.dumps(doc, protocol=pickle.HIGHEST_PROTOCOL), time.time()))
+            self._pending += 1
+
+    def failed(self):
+        """Writes given up on after OUTBOX_MAX_ATTEMPTS, as (kind, doc, last_error)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT kind, payload, last_error FROM outbox WHERE failed = 1 ORDER BY id").fetchall()
+        return [(kind, pickle.loads(payload), error) for kind, payload, error in rows]
+
+    def flush(self, writers, breaker):
+        """Replay queued writes oldest first with writers[kind](doc); returns the docs written
+
+        Stops at the first connection error so the order is kept for the next flush. A
+        write rejected by the server is retried on later flushes and marked failed after
+        OUTBOX_MAX_ATTEMPTS. Only one flush runs at a time; concurrent callers return [].
+        """
+        if not self._flush_lock.acquire(blocking=False):
+            return []
+        written = []
+        try:
+            while True:
+                with self._lock:
+                    row = self._conn.execute("SELECT id, kind, payload, attempts FROM outbox "
+                                             "WHERE failed = 0 ORDER BY id LIMIT 1").fetchone()
+                if row is None:
+                    break
+                row_id, kind, payload, attempts = row
+                doc = pickle.loads(payload)
+                try:
+                    breaker.call(lambda: writers[kind](doc))
+                except DuplicateKeyError:
+                    # Sudah tertulis oleh flush sebelumnya yang terputus sebelum baris ini dihapus
+                    pass
+                except Exception as e:
+                    if is_connection_error(e):
+                        break
+                    given_up = attempts + 1 >= OUTBOX_MAX_ATTEMPTS
+                    with self._lock:
+                        self._conn.execute("UPDATE outbox SET attempts = ?, last_error = ?, failed = ? WHERE id = ?",
+                                           (attempts + 1, str(e), int(given_up), row_id))
+                        if given_up:
+                            self._pending -= 1
+                    logger.warning("tulisan %s #%s ditolak: %s", kind, row_id, e)
+                    if not given_up:
+                        break
+                    continue
+                with self._lock:
+                    self._conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                    self._pending -= 1
+                written.append(doc)
+        finally:
+            self._flush_lock.release()
+        return written
+
+
+# Satu breaker untuk seluruh proses; snapshot dan antrean hanya aktif setelah configure()
+breaker = CircuitBreaker()
+snapshots = None
+outbox = None
+_configure_lock = threading.Lock()
+
+
+def configure(path=SNAPSHOT_PATH, failure_threshold=FAILURE_THRESHOLD, reset_seconds=RESET_SECONDS,
+              max_age=SNAPSHOT_MAX_AGE_SECONDS, health_check=None):
+    """Enable the snapshot cache and the write outbox; later calls only update the breaker settings"""
+    global snapshots, outbox
+
+    with _configure_lock:
+        breaker.failure_threshold = failure_threshold
+        breaker.reset_seconds = reset_seconds
+        breaker.health_check = health_check
+        if snapshots is None:
+            snapshots = SnapshotStore(path, max_age=max_age)
+            outbox = WriteOutbox(path)
+            # Semua pembacaan lewat read_cache sekarang melewati breaker dan menyimpan snapshot
+            read_cache.fallback = load
+
+
+def configure_from_secrets(offline_secrets, health_check=None):
+    """Apply the optional [offline] secrets section (enabled, path, failure_threshold, ...)"""
+    if not offline_secrets.get("enabled", True):
+        return
+    configure(
+        path=offline_secrets.get("path", SNAPSHOT_PATH),
+        failure_threshold=int(offline_secrets.get("failure_threshold", FAILURE_THRESHOLD)),
+        reset_seconds=float(offline_secrets.get("reset_seconds", RESET_SECONDS)),
+        max_age=float(offline_secrets.get("snapshot_max_age_hours", SNAPSHOT_MAX_AGE_SECONDS / 3600)) * 3600,
+        health_check=health_check,
+    )
+
+
+def load(key, loader):
+    """Run a read-cache loader through the breaker; returns (value, fresh)
+
+    A fresh result is saved as the key's snapshot. When MongoDB is unreachable the last
+    snapshot is returned with fresh=False; without one the connection error is raised.
+    """
+    try:
+        value = breaker.call(loader)
+    except Exception as e:
+        if snapshots is None or not is_connection_error(e):
+            raise
+        snapshot = snapshots.get(key)
+        if snapshot is None:
+            raise
+        return snapshot[0], False
+    if snapshots is not None:
+        snapshots.save(key, value)
+    return value, True
+
+
+def write(kind, doc, writer):
+    """Write `doc` now, or queue it durably when MongoDB is unreachable
+
+    Returns "saved", "repeated" when the writer returned False because the submission was
+    already saved, or "queued". While earlier writes are still queued, new ones queue
+    behind them so they reach MongoDB in order.
+    """
+    # _id ditentukan sebelum percobaan pertama supaya replay dari antrean tidak menggandakan dokumen
+    doc.setdefault("_id", ObjectId())
+    if outbox is None:
+        return "repeated" if breaker.call(lambda: writer(doc)) is False else "saved"
+    if not outbox.pending():
+        try:
+            return "repeated" if breaker.call(lambda: writer(doc)) is False else "saved"
+        except Exception as e:
+            if not is_connection_error(e):
+                raise
+    outbox.enqueue(kind, doc)
+    return "queued"
+
+
+def flush(writers):
+    """Replay the outbox if the breaker is closed; returns the docs written"""
+    if outbox is None or not outbox.pending() or breaker.state != "closed":
+        return []
+    return outbox.flush(writers, breaker)
+
+
+def degraded():
+    """True while reads are being served from snapshots instead of MongoDB"""
+    return breaker.state != "closed"
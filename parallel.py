@@ -0,0 +1,52 @@
+# parallel.py - menjalankan beberapa pembacaan independen secara bersamaan
+
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import pymongo
+
+# Dipakai bersama semua sesi; cukup kecil supaya tidak menghabiskan connection pool
+MAX_WORKERS = 8
+DEFAULT_TIMEOUT = 3.0
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="ceritakita-fetch")
+
+
+class FetchTimeout(FutureTimeoutError):
+    """A loader did not finish within its timeout"""
+
+
+def _run(loader, timeout):
+    # Timeout driver (CSOT) ikut membatasi operasi di server, bukan hanya penantian di sini
+    with pymongo.timeout(timeout):
+        return loader()
+
+
+def fetch_all(loaders, timeout=DEFAULT_TIMEOUT, timeouts=None):
+    """Run independent loaders concurrently and return {name: (value, error)}
+
+    Every loader gets its own timeout (`timeouts[name]`, else `timeout`, in seconds), so the
+    total wait is bounded by the slowest single call. A loader that raises or times out
+    yields (None, error) and the others are unaffected, which lets the page render what it
+    has. Loaders run with a copy of the caller's context, so metrics page tags carry over.
+    """
+    timeouts = timeouts or {}
+    started_at = time.monotonic()
+    futures = {}
+    for name, loader in loaders.items():
+        call_timeout = timeouts.get(name, timeout)
+        context = contextvars.copy_context()
+        futures[name] = (_executor.submit(context.run, _run, loader, call_timeout), call_timeout)
+
+    results = {}
+    for name, (future, call_timeout) in futures.items():
+        remaining = max(0.0, started_at + call_timeout - time.monotonic())
+        try:
+            results[name] = (future.result(timeout=remaining), None)
+        except FutureTimeoutError:
+            # Thread tetap selesai di background; hasilnya masuk cache untuk rerun berikutnya
+            results[name] = (None, FetchTimeout(f"melebihi batas waktu {call_timeout:g} detik"))
+        except Exception as e:
+            results[name] = (None, e)
+    return results
@@ -0,0 +1,69 @@
+# records.py - tipe record ringan (Couple, Mood, Quote) untuk dokumen yang dirender halaman
+
+from bson.objectid import ObjectId
+
+
+class Record:
+    """Slotted read model holding only the fields a page renders
+
+    Subclasses list their fields in __slots__; `id` is the document's _id as a string.
+    projection() asks MongoDB for exactly those fields, and from_doc() copies them out of
+    the decoded document without walking nested values. Item access (`record['field']`,
+    `record.get('field')`, `record['_id']`) works like the dicts pages used to receive,
+    so cached values and snapshots of either shape render the same.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def projection(cls):
+        fields = {field: 1 for field in cls.__slots__ if field != "id"}
+        if "id" not in cls.__slots__:
+            fields["_id"] = 0
+        return fields
+
+    @classmethod
+    def from_doc(cls, doc):
+        """Build a record from a document returned with projection(); None stays None"""
+        if doc is None:
+            return None
+        record = cls.__new__(cls)
+        for field in cls.__slots__:
+            if field == "id":
+                value = doc.get("_id")
+                record.id = str(value) if isinstance(value, ObjectId) else value
+            else:
+                setattr(record, field, doc.get(field))
+        return record
+
+    @classmethod
+    def from_docs(cls, docs):
+        return [cls.from_doc(doc) for doc in docs]
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, "id" if field == "_id" else field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Couple(Record):
+    __slots__ = ("id", "couple_code", "person1_name", "person2_name")
+
+
+class Mood(Record):
+    __slots__ = ("id", "mood_emoji", "mood_note", "created_at")
+
+
+class Quote(Record):
+    __slots__ = ("id", "quote_text", "author", "added_by", "created_at")
@@ -0,0 +1,1012 @@
+# repository.py - lapisan akses data; halaman memanggil repo, bukan koleksi MongoDB langsung
+
+import os
+import random
+import zlib
+from collections import defaultdict
+from itertools import groupby
+from datetime import date, datetime, time, timedelta, timezone
+
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import search
+from records import Couple, Mood, Quote
+
+# Skor mood untuk grafik: 1 paling bahagia, 5 paling sedih
+MOOD_SCORES = {"😍": 1, "😊": 2, "😐": 3, "😔": 4, "😢": 5}
+
+# Field mood yang disalin ke couples.latest_moods untuk dashboard
+LATEST_MOOD_FIELDS = ("mood_emoji", "mood_note", "created_at")
+
+# Field yang dibaca per tampilan; halaman menerima record dari records.py dengan field yang sama
+COUPLE_PROFILE_FIELDS = Couple.projection()
+QUOTE_CARD_FIELDS = {"_id": 0, "quote_text": 1, "author": 1}
+QUOTE_LIST_FIELDS = Quote.projection()
+MOOD_HISTORY_FIELDS = Mood.projection()
+MOOD_EXPORT_FIELDS = {"_id": 0, "user_id": 1, "mood_emoji": 1, "mood_note": 1, "created_at": 1}
+QUOTE_EXPORT_FIELDS = {"_id": 0, "quote_text": 1, "author": 1, "added_by": 1, "created_at": 1}
+
+# Author quote yang disimpan kalau kosong, baik dari form maupun impor
+UNKNOWN_AUTHOR = "Unknown"
+
+# Cara menyimpan mood: "flat" = satu dokumen per mood di `moods`,
+# "bucket" = satu dokumen per user per bulan di `mood_buckets`
+MOOD_STORAGE_ENV = "CERITAKITA_MOOD_STORAGE"
+MOOD_STORAGES = ("flat", "bucket")
+BUCKET_COLLECTION = "mood_buckets"
+# Jumlah mood maksimum per bucket; bulan yang lebih ramai berlanjut ke bucket berikutnya
+BUCKET_SIZE = 500
+# Field mood yang disimpan di dalam bucket; couple_id dan user_id ada di bucket-nya
+BUCKET_MOOD_FIELDS = ("_id", "mood_emoji", "mood_note", "created_at", "idempotency_key")
+# Quote of the day yang sudah dipilih, satu dokumen per couple: {_id: couple_id, day, quote}
+DAILY_QUOTE_COLLECTION = "daily_quotes"
+# Kunci mood terakhir yang sudah masuk statistik, supaya simpan ulang tidak menghitungnya dua kali
+STATS_APPLIED_KEYS = 100
+
+
+def get_mood_storage(moods_secrets=None):
+    """Return the mood storage mode: CERITAKITA_MOOD_STORAGE, else [moods] storage, else "flat" """
+    storage = os.environ.get(MOOD_STORAGE_ENV) or (moods_secrets or {}).get("storage", "flat")
+    storage = storage.lower()
+    if storage not in MOOD_STORAGES:
+        raise ValueError(f"mood storage harus salah satu dari {', '.join(MOOD_STORAGES)}, bukan {storage!r}")
+    return storage
+
+
+def parse_timestamp(value):
+    """Return an aware datetime from a BSON datetime or a legacy naive ISO string (server local time)"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.astimezone()
+    return value
+
+
+def keyset_page(collection, query, projection, after=None, limit=10):
+    """Fetch one page newest first, keyset-paginated on (created_at, _id)
+
+    `after` is the cursor returned for the previous page. Returns (docs, next_cursor);
+    next_cursor is None on the last page.
+    """
+    if after:
+        created_at, last_id = after
+        older = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": last_id}},
+        ]
+        # Operator pembanding tidak melintasi tipe BSON; ISO string lama selalu
+        # terurut setelah semua datetime, jadi ikut sebagai "lebih lama"
+        if isinstance(created_at, datetime):
+            older.append({"created_at": {"$type": "string"}})
+        query = {"$and": [query, {"$or": older}]}
+
+    # Ambil satu dokumen ekstra untuk tahu apakah masih ada halaman berikutnya
+    docs = list(collection.find(query, projection).sort([("created_at", -1), ("_id", -1)]).limit(limit + 1))
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = (docs[-1]['created_at'], docs[-1]['_id'])
+    return docs, next_cursor
+
+
+def as_records(record, result):
+    """(docs, more) from a page or search -> (records, more)"""
+    docs, more = result
+    return record.from_docs(docs), more
+
+
+def insert_unordered(collection, docs):
+    """insert_many without stopping at the first error; returns the docs that were written"""
+    if not docs:
+        return []
+    try:
+        collection.insert_many(docs, ordered=False)
+        return docs
+    except BulkWriteError as e:
+        failed = {error["index"] for error in e.details.get("writeErrors", ())}
+        return [doc for i, doc in enumerate(docs) if i not in failed]
+
+
+def mood_key(mood):
+    """Idempotency key of a mood; its _id for moods saved without one"""
+    return mood.get('idempotency_key') or str(mood['_id'])
+
+
+def insert_idempotent(insert, doc):
+    """Run insert(doc); returns False if a doc with the same idempotency_key already exists
+
+    Other duplicate key errors are raised as usual.
+    """
+    try:
+        insert(doc)
+    except DuplicateKeyError:
+        if not doc.get("idempotency_key"):
+            raise
+        return False
+    return True
+
+
+def bucket_month(created_at):
+    """UTC month ("YYYY-MM") of the bucket a mood belongs to"""
+    return parse_timestamp(created_at).astimezone(timezone.utc).strftime("%Y-%m")
+
+
+def bucket_update(couple_id, user_id, moods):
+    """(filter, update) upsert appending moods of one (couple, user, month) to a bucket with room
+
+    A full bucket no longer matches the filter, so the upsert starts a new one. Every entry
+    carries an idempotency_key (its _id when the client sent none); a bucket already holding
+    one of the keys does not match either, and the upsert then fails on the unique index.
+    """
+    created = [parse_timestamp(mood['created_at']) for mood in moods]
+    entries = [dict({k: mood.get(k) for k in BUCKET_MOOD_FIELDS}, created_at=created_at, idempotency_key=mood_key(mood))
+               for mood, created_at in zip(moods, created)]
+    doc_filter = {"couple_id": couple_id, "user_id": user_id, "month": bucket_month(created[0]),
+                  "count": {"$lte": BUCKET_SIZE - len(moods)},
+                  # Unique index hanya berlaku antar dokumen, jadi duplikat di bucket yang sama dicegah di sini
+                  "moods.idempotency_key": {"$nin": [entry['idempotency_key'] for entry in entries]}}
+    update = {"$push": {"moods": {"$each": entries}},
+              "$inc": {"count": len(moods)},
+              "$min": {"first_created_at": min(created)},
+              "$max": {"last_created_at": max(created)}}
+    return doc_filter, update
+
+
+def bucket_chunks(moods):
+    """Group moods by (couple_id, user_id, month) into chunks that fit in one bucket"""
+    groups = defaultdict(list)
+    for mood in moods:
+        groups[(mood['couple_id'], mood['user_id'], bucket_month(mood['created_at']))].append(mood)
+    for group in groups.values():
+        for i in range(0, len(group), BUCKET_SIZE):
+            yield group[i:i + BUCKET_SIZE]
+
+
+def merge_bucket_moods(buckets, newest_first=True):
+    """Yield the moods inside `buckets` in (created_at, _id) order, tagged with couple_id and user_id
+
+    Buckets must arrive sorted by last_created_at descending (newest_first) or by
+    first_created_at ascending. Buckets of the same month may overlap, so moods are held
+    back only until no later bucket can contain one that sorts before them.
+    """
+    def sort_key(mood):
+        return (mood['created_at'], mood['_id'])
+
+    pending = []
+    for bucket in buckets:
+        boundary = bucket['last_created_at'] if newest_first else bucket['first_created_at']
+        ready, held = [], []
+        for mood in pending:
+            before_boundary = mood['created_at'] > boundary if newest_first else mood['created_at'] < boundary
+            (ready if before_boundary else held).append(mood)
+        pending = held
+        yield from sorted(ready, key=sort_key, reverse=newest_first)
+        pending.extend(dict(mood, couple_id=bucket['couple_id'], user_id=bucket['user_id'])
+                       for mood in bucket.get('moods', ()))
+    yield from sorted(pending, key=sort_key, reverse=newest_first)
+
+
+def local_date_range(start_date, end_date):
+    """Local-midnight datetimes bounding start_date..end_date (inclusive)"""
+    range_start = datetime.combine(start_date, time.min).astimezone()
+    range_end = datetime.combine(end_date + timedelta(days=1), time.min).astimezone()
+    return range_start, range_end
+
+
+# Metrik kecocokan saat belum ada periode yang dicatat keduanya
+EMPTY_AGREEMENT = {"shared_periods": 0, "mean_abs_diff": None, "agreement_rate": None, "max_diff": None}
+
+
+def mood_period_expressions(unit):
+    """Aggregation expressions for a mood's (period, score); period is its local day/week/month"""
+    # Tanggal lokal tiap mood: BSON datetime dikonversi ke zona waktu server,
+    # ISO string lama sudah waktu lokal sehingga 10 karakter pertama adalah tanggalnya
+    local_offset = datetime.now().astimezone().strftime("%z")
+    day_label = {"$cond": [
+        {"$eq": [{"$type": "$created_at"}, "string"]},
+        {"$substrBytes": ["$created_at", 0, 10]},
+        {"$dateToString": {"date": "$created_at", "format": "%Y-%m-%d", "timezone": local_offset}},
+    ]}
+    day = {"$dateFromString": {"dateString": day_label}}
+    if unit == "day":
+        period = day
+    elif unit == "week":
+        period = {"$dateTrunc": {"date": day, "unit": "week", "startOfWeek": "monday"}}
+    else:
+        period = {"$dateTrunc": {"date": day, "unit": unit}}
+    score = {"$switch": {
+        "branches": [{"case": {"$eq": ["$mood_emoji", emoji]}, "then": value} for emoji, value in MOOD_SCORES.items()],
+        "default": None,
+    }}
+    return period, score
+
+
+def created_at_between(start_date, end_date):
+    """$or clause matching created_at between two local dates (inclusive)"""
+    range_start, range_end = local_date_range(start_date, end_date)
+    # Selama masa transisi created_at bisa berupa datetime atau ISO string
+    return [
+        {"created_at": {"$gte": range_start, "$lt": range_end}},
+        {"created_at": {"$gte": range_start.replace(tzinfo=None).isoformat(),
+                        "$lt": range_end.replace(tzinfo=None).isoformat()}},
+    ]
+
+
+def period_start(day, unit):
+    """First day of the day/week (Monday)/month containing `day`"""
+    if unit == "week":
+        return day - timedelta(days=day.weekday())
+    if unit == "month":
+        return day.replace(day=1)
+    return day
+
+
+class CouplesRepo:
+    """Couple documents, including the denormalized latest mood of each partner"""
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.couples
+
+    def find_by_code(self, couple_code):
+        return Couple.from_doc(self.collection.find_one({"couple_code": couple_code}, COUPLE_PROFILE_FIELDS))
+
+    def create(self, couple_code, name, created_at):
+        """Insert a new couple and return its id; raises DuplicateKeyError if the code is taken"""
+        result = self.collection.insert_one({
+            "couple_code": couple_code,
+            "person1_name": name,
+            "person2_name": None,
+            "latest_moods": {},
+            "created_at": created_at,
+        })
+        return str(result.inserted_id) if result.inserted_id else None
+
+    def join_as_person2(self, couple_id, name):
+        """Claim the empty person2 slot; False if someone else claimed it first"""
+        result = self.collection.update_one(
+            {"_id": ObjectId(couple_id), "person2_name": None},
+            {"$set": {"person2_name": name}},
+        )
+        return result.modified_count == 1
+
+    def profile(self, couple_id):
+        return Couple.from_doc(self.collection.find_one({"_id": ObjectId(couple_id)}, COUPLE_PROFILE_FIELDS))
+
+    def update_profile(self, couple_id, fields):
+        self.collection.update_one({"_id": ObjectId(couple_id)}, {"$set": fields})
+
+    def record_latest_mood(self, mood):
+        """Copy a saved mood into couples.latest_moods.<user_id> unless a newer one is already there
+
+        The filter and $set run as one atomic single-document update, so concurrent saves
+        can never replace a newer snapshot with an older one.
+        """
+        field = f"latest_moods.{mood['user_id']}"
+        self.collection.update_one(
+            {"_id": ObjectId(mood['couple_id']), "$or": [
+                {field: {"$exists": False}},
+                {f"{field}.created_at": {"$lt": mood['created_at']}},
+                {f"{field}.created_at": {"$type": "string"}},
+            ]},
+            {"$set": {field: {k: mood[k] for k in LATEST_MOOD_FIELDS}}},
+        )
+
+    def latest_moods(self, couple_id):
+        """Return {user_id: latest mood} for both partners with a single point read"""
+        couple = self.collection.find_one({"_id": ObjectId(couple_id)}, {"_id": 0, "latest_moods": 1})
+        if couple is None:
+            return {}
+        if "latest_moods" in couple:
+            return couple['latest_moods']
+
+        # Couple lama yang belum punya snapshot: isi sekali dari riwayat mood
+        latest_moods = {}
+        for user_id in ("person1", "person2"):
+            mood = self.db.moods.find_one({"couple_id": couple_id, "user_id": user_id},
+                                          {"_id": 0, **{k: 1 for k in LATEST_MOOD_FIELDS}},
+                                          sort=[("created_at", -1)])
+            if mood:
+                latest_moods[user_id] = mood
+        self.collection.update_one({"_id": ObjectId(couple_id), "latest_moods": {"$exists": False}},
+                                   {"$set": {"latest_moods": latest_moods}})
+        return latest_moods
+
+
+STATS_COLLECTION = "mood_stats"
+
+# Rata-rata bergulir yang ditampilkan (hari); bucket harian disimpan secukupnya untuk yang terpanjang
+ROLLING_WINDOWS = (7, 30)
+DAILY_BUCKET_DAYS = max(ROLLING_WINDOWS)
+
+
+def stats_id(couple_id, user_id):
+    return f"{couple_id}:{user_id}"
+
+
+def local_day(created_at):
+    """Calendar day of a mood in the server's time zone, the same day the charts use"""
+    return parse_timestamp(created_at).astimezone().date()
+
+
+class StatsAccumulator:
+    """Apply moods to a stats document, tracking both the new state and the deltas
+
+    Moods must be applied oldest first. The streak only moves forward: a mood older than
+    the last logged day (e.g. from an import) counts towards the totals but leaves the
+    streak alone until the next rebuild. The keys of the last STATS_APPLIED_KEYS moods are
+    kept in `applied_keys`, and a mood whose key is already there is skipped.
+    """
+
+    def __init__(self, stats=None, today=None):
+        stats = stats or {}
+        self.today = today or date.today()
+        self.rev = stats.get("rev")
+        self.applied_keys = set(stats.get("applied_keys", ()))
+        self.keys = []
+        self.existing_days = set(stats.get("daily", {}))
+        last_day = stats.get("last_day")
+        self.last_day = date.fromisoformat(last_day) if last_day else None
+        self.current_streak = stats.get("current_streak", 0)
+        self.longest_streak = stats.get("longest_streak", 0)
+        self.inc = {}
+
+    def _add(self, path, value):
+        self.inc[path] = self.inc.get(path, 0) + value
+
+    def apply(self, mood):
+        if "_id" in mood or mood.get('idempotency_key'):
+            key = mood_key(mood)
+            if key in self.applied_keys:
+                return
+            self.applied_keys.add(key)
+            self.keys.append(key)
+        day = local_day(mood['created_at'])
+        score = MOOD_SCORES.get(mood['mood_emoji'])
+
+        self._add("count", 1)
+        self._add(f"emoji_counts.{mood['mood_emoji']}", 1)
+        if score is not None:
+            self._add("score_sum", score)
+            self._add("scored", 1)
+            if day > self.today - timedelta(days=DAILY_BUCKET_DAYS):
+                self._add(f"daily.{day.isoformat()}.sum", score)
+                self._add(f"daily.{day.isoformat()}.count", 1)
+
+        if self.last_day is None or day > self.last_day:
+            if self.last_day is not None and day == self.last_day + timedelta(days=1):
+                self.current_streak += 1
+            else:
+                self.current_streak = 1
+            self.last_day = day
+            self.longest_streak = max(self.longest_streak, self.current_streak)
+
+    def _state(self):
+        return {
+            "last_day": self.last_day.isoformat() if self.last_day else None,
+            "current_streak": self.current_streak,
+            "longest_streak": self.longest_streak,
+            "updated_at": datetime.now(timezone.utc),
+        }
+
+    def stale_days(self):
+        cutoff = (self.today - timedelta(days=DAILY_BUCKET_DAYS)).isoformat()
+        return sorted(day for day in self.existing_days if day <= cutoff)
+
+    def update(self, couple_id, user_id):
+        """Return (filter, update) applying the accumulated moods with $inc/$set/$unset
+
+        The filter pins the document revision, so a concurrent update makes this one
+        match nothing and the caller re-reads and retries.
+        """
+        doc_filter = {"_id": stats_id(couple_id, user_id)}
+        doc_filter["rev"] = self.rev if self.rev is not None else {"$exists": False}
+        update = {
+            "$inc": dict(self.inc, rev=1),
+            "$set": dict(self._state(), couple_id=couple_id, user_id=user_id),
+        }
+        if self.keys:
+            update["$push"] = {"applied_keys": {"$each": self.keys, "$slice": -STATS_APPLIED_KEYS}}
+        stale = self.stale_days()
+        if stale:
+            update["$unset"] = {f"daily.{day}": "" for day in stale}
+        return doc_filter, update
+
+    def document(self, couple_id, user_id):
+        """Return the full stats document, for a rebuild that started from nothing"""
+        doc = {"_id": stats_id(couple_id, user_id), "couple_id": couple_id, "user_id": user_id, "rev": 1,
+               "count": 0, "score_sum": 0, "scored": 0, "emoji_counts": {}, "daily": {},
+               "applied_keys": self.keys[-STATS_APPLIED_KEYS:]}
+        for path, value in self.inc.items():
+            target = doc
+            *parents, leaf = path.split(".")
+            for part in parents:
+                target = target.setdefault(part, {})
+            target[leaf] = target.get(leaf, 0) + value
+        doc.update(self._state())
+        return doc
+
+
+def summarize(stats, today=None):
+    """Turn a stats document into the numbers shown on the stats card"""
+    today = today or date.today()
+    stats = stats or {}
+    summary = {
+        "count": stats.get("count", 0),
+        "average": round(stats["score_sum"] / stats["scored"], 2) if stats.get("scored") else None,
+        "distribution": {emoji: stats.get("emoji_counts", {}).get(emoji, 0) for emoji in MOOD_SCORES},
+        "longest_streak": stats.get("longest_streak", 0),
+        "current_streak": 0,
+        # Naik setiap kali mood user disimpan; dipakai sebagai kunci cache grafik
+        "version": stats.get("rev", 0),
+    }
+
+    # Streak masih berjalan jika mood terakhir hari ini atau kemarin
+    last_day = stats.get("last_day")
+    if last_day and date.fromisoformat(last_day) >= today - timedelta(days=1):
+        summary["current_streak"] = stats.get("current_streak", 0)
+
+    daily = stats.get("daily", {})
+    for window in ROLLING_WINDOWS:
+        start = (today - timedelta(days=window - 1)).isoformat()
+        buckets = [bucket for day, bucket in daily.items() if start <= day <= today.isoformat()]
+        count = sum(bucket["count"] for bucket in buckets)
+        summary[f"count_{window}d"] = count
+        summary[f"average_{window}d"] = round(sum(bucket["sum"] for bucket in buckets) / count, 2) if count else None
+    return summary
+
+
+class MoodStatsRepo:
+    """Per-user mood statistics, one small document per (couple_id, user_id)"""
+
+    # Percobaan ulang saat dokumen statistik diubah bersamaan
+    MAX_RETRIES = 5
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db[STATS_COLLECTION]
+
+    def get(self, couple_id, user_id):
+        return self.collection.find_one({"_id": stats_id(couple_id, user_id)})
+
+    def summary(self, couple_id, user_id):
+        return summarize(self.get(couple_id, user_id))
+
+    def record(self, couple_id, user_id, moods):
+        """Fold newly saved moods into the user's stats document with one conditional update
+
+        Moods already folded in (same key in applied_keys) are skipped, so recording a mood
+        again after a failed save does not count it twice.
+        """
+        moods = sorted(moods, key=lambda mood: parse_timestamp(mood['created_at']))
+        for _ in range(self.MAX_RETRIES):
+            accumulator = StatsAccumulator(self.get(couple_id, user_id))
+            for mood in moods:
+                accumulator.apply(mood)
+            if not accumulator.inc:
+                return
+            doc_filter, update = accumulator.update(couple_id, user_id)
+            try:
+                result = self.collection.update_one(doc_filter, update, upsert=accumulator.rev is None)
+            except DuplicateKeyError:
+                # Dokumen baru dibuat bersamaan oleh penulis lain
+                continue
+            if result.matched_count or result.upserted_id is not None:
+                return
+        raise RuntimeError(f"Statistik mood {stats_id(couple_id, user_id)} terus berubah, coba lagi")
+
+    def rebuild_all(self, moods, progress=None):
+        """Recompute every stats document from `moods`, e.g. MoodsRepo.iter_by_user()
+
+        Moods must arrive grouped by (couple_id, user_id), oldest first within a user, so
+        only one user's accumulator is in memory at a time.
+        """
+        rebuilt = 0
+        current_key = None
+        accumulator = None
+
+        def flush():
+            nonlocal rebuilt
+            couple_id, user_id = current_key
+            doc = accumulator.document(couple_id, user_id)
+            # rev tetap naik supaya cache yang dikunci dengan versi lama tidak terpakai lagi
+            existing = self.collection.find_one({"_id": doc["_id"]}, {"rev": 1})
+            doc["rev"] = (existing or {}).get("rev", 0) + 1
+            self.collection.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+            rebuilt += 1
+            if progress:
+                progress(rebuilt)
+
+        for mood in moods:
+            key = (mood.get('couple_id'), mood.get('user_id'))
+            if key != current_key:
+                if accumulator is not None:
+                    flush()
+                current_key = key
+                accumulator = StatsAccumulator()
+            accumulator.apply(mood)
+
+        if accumulator is not None:
+            flush()
+        return rebuilt
+
+
+class MoodsRepo:
+    """Mood entries per (couple_id, user_id)"""
+
+    use_text_index = True
+
+    def __init__(self, db, couples, stats):
+        self.collection = db.moods
+        self.couples = couples
+        self.stats = stats
+
+    def add(self, mood):
+        """Insert a mood and update everything derived from it; returns False for a repeated submission
+
+        A mood whose idempotency_key was already saved for the couple (a double click or a
+        retried request) is not written again. The derived updates are still applied for
+        the stored mood, since the save that wrote it may have failed before finishing them;
+        both are idempotent.
+        """
+        if not insert_idempotent(self._insert_one, mood):
+            stored = self.find_by_key(mood['couple_id'], mood['idempotency_key'])
+            if stored is not None:
+                self._record_derived(stored)
+            return False
+        self._record_derived(mood)
+        search.notify_insert(self.collection.name, {"couple_id": mood['couple_id'], "user_id": mood['user_id']}, mood)
+        return True
+
+    def _record_derived(self, mood):
+        self.couples.record_latest_mood(mood)
+        self.stats.record(mood['couple_id'], mood['user_id'], [mood])
+
+    def find_by_key(self, couple_id, idempotency_key):
+        """The saved mood with this idempotency_key, or None"""
+        return self.collection.find_one({"couple_id": couple_id, "idempotency_key": idempotency_key})
+
+    def add_many(self, moods):
+        """Insert a batch of moods (unordered) and return the ones that were written"""
+        inserted = self._insert_many(moods)
+        by_user = defaultdict(list)
+        for mood in inserted:
+            by_user[(mood['couple_id'], mood['user_id'])].append(mood)
+            search.notify_insert(self.collection.name, {"couple_id": mood['couple_id'], "user_id": mood['user_id']}, mood)
+        for (couple_id, user_id), user_moods in by_user.items():
+            self.couples.record_latest_mood(max(user_moods, key=lambda mood: mood['created_at']))
+            self.stats.record(couple_id, user_id, user_moods)
+        return inserted
+
+    def _insert_one(self, mood):
+        self.collection.insert_one(mood)
+
+    def _insert_many(self, moods):
+        return insert_unordered(self.collection, moods)
+
+    def _moods(self, query):
+        """Moods matching a couple_id/user_id query, with user_id, mood_emoji and created_at"""
+        return self.collection.find(query, {"_id": 0, "user_id": 1, "mood_emoji": 1, "created_at": 1})
+
+    def _range_stages(self, query, start_date, end_date):
+        """Aggregation stages that select the moods of `query` between two dates"""
+        return [{"$match": dict(query, **{"$or": created_at_between(start_date, end_date)})}]
+
+    def iter_couple(self, couple_id, batch_size=1000):
+        """Stream every mood of a couple in index order (per user, newest first)"""
+        return (self.collection.find({"couple_id": couple_id}, MOOD_EXPORT_FIELDS)
+                .sort([("user_id", 1), ("created_at", -1), ("_id", -1)])
+                .batch_size(batch_size))
+
+    def iter_by_user(self, batch_size=1000, projection=None):
+        """Stream every mood grouped by (couple_id, user_id), oldest first within a user"""
+        projection = projection or {"couple_id": 1, "user_id": 1, "mood_emoji": 1, "created_at": 1, "idempotency_key": 1}
+        return (self.collection.find({}, projection)
+                .sort([("couple_id", -1), ("user_id", -1), ("created_at", 1), ("_id", 1)])
+                .batch_size(batch_size))
+
+    def remove(self, mood_ids):
+        """Delete moods by _id and return how many were removed; stats are not updated"""
+        return self.collection.delete_many({"_id": {"$in": list(mood_ids)}}).deleted_count
+
+    def count(self, couple_id, user_id):
+        return self.collection.count_documents({"couple_id": couple_id, "user_id": user_id})
+
+    def page(self, couple_id, user_id, after=None, limit=5):
+        return as_records(Mood, keyset_page(self.collection, {"couple_id": couple_id, "user_id": user_id},
+                                            MOOD_HISTORY_FIELDS, after=after, limit=limit))
+
+    def search(self, couple_id, user_id, query, page=0, page_size=10):
+        return as_records(Mood, search.search(self.collection, {"couple_id": couple_id, "user_id": user_id},
+                                              query, page, page_size, use_text_index=self.use_text_index))
+
+    def timeseries(self, couple_id, user_id, unit, start_date, end_date):
+        """Average mood score and entry count per day/week/month between two dates (inclusive)
+
+        Bucketing happens in MongoDB, so the result size depends on the date range, not on
+        the number of moods logged.
+        """
+        period, score = mood_period_expressions(unit)
+        pipeline = self._range_stages({"couple_id": couple_id, "user_id": user_id}, start_date, end_date) + [
+            {"$group": {"_id": period, "score": {"$avg": score}, "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+            {"$project": {"_id": 0, "period": "$_id", "score": {"$round": ["$score", 2]}, "count": 1}},
+        ]
+        return list(self.collection.aggregate(pipeline))
+
+    def couple_timeline(self, couple_id, unit, start_date, end_date):
+        """Both partners' mood series plus agreement metrics, from one aggregation
+
+        Moods are grouped by (user_id, period) in MongoDB; a $facet then returns the series
+        and, over the periods where both partners logged, the mean absolute score
+        difference, the share of periods within one point and the largest gap. The result
+        size depends on the number of periods, not on the number of moods.
+        """
+        period, score = mood_period_expressions(unit)
+        pipeline = self._range_stages({"couple_id": couple_id}, start_date, end_date) + [
+            {"$group": {"_id": {"user_id": "$user_id", "period": period},
+                        "score": {"$avg": score}, "count": {"$sum": 1}}},
+            {"$facet": {
+                "series": [
+                    {"$sort": {"_id.period": 1, "_id.user_id": 1}},
+                    {"$project": {"_id": 0, "user_id": "$_id.user_id", "period": "$_id.period",
+                                  "score": {"$round": ["$score", 2]}, "count": 1}},
+                ],
+                "agreement": [
+                    {"$match": {"score": {"$ne": None}}},
+                    {"$group": {"_id": "$_id.period", "scores": {"$push": "$score"}}},
+                    # Hanya periode saat keduanya mencatat mood
+                    {"$match": {"scores.1": {"$exists": True}}},
+                    {"$project": {"diff": {"$abs": {"$subtract": [{"$arrayElemAt": ["$scores", 0]},
+                                                                  {"$arrayElemAt": ["$scores", 1]}]}}}},
+                    {"$group": {
+                        "_id": None,
+                        "shared_periods": {"$sum": 1},
+                        "mean_abs_diff": {"$avg": "$diff"},
+                        "agreeing": {"$sum": {"$cond": [{"$lte": ["$diff", 1]}, 1, 0]}},
+                        "max_diff": {"$max": "$diff"},
+                    }},
+                    {"$project": {
+                        "_id": 0,
+                        "shared_periods": 1,
+                        "mean_abs_diff": {"$round": ["$mean_abs_diff", 2]},
+                        "agreement_rate": {"$round": [{"$divide": ["$agreeing", "$shared_periods"]}, 2]},
+                        "max_diff": {"$round": ["$max_diff", 2]},
+                    }},
+                ],
+            }},
+        ]
+        result = next(self.collection.aggregate(pipeline), {"series": [], "agreement": []})
+        agreement = result["agreement"][0] if result["agreement"] else EMPTY_AGREEMENT
+        return result["series"], agreement
+
+
+class BucketMoodsRepo(MoodsRepo):
+    """MoodsRepo storing moods in per-user monthly bucket documents (`mood_buckets`)
+
+    Each bucket holds up to BUCKET_SIZE moods of one (couple_id, user_id, month), so the
+    collection and its indexes grow with months instead of entries. A save is a single
+    $push upsert; readers unwind the buckets and return the same shapes as MoodsRepo.
+    """
+
+    use_text_index = False
+
+    def __init__(self, db, couples, stats):
+        super().__init__(db, couples, stats)
+        self.collection = db[BUCKET_COLLECTION]
+
+    def _insert_one(self, mood):
+        mood.setdefault("_id", ObjectId())
+        self.collection.update_one(*bucket_update(mood['couple_id'], mood['user_id'], [mood]), upsert=True)
+
+    def find_by_key(self, couple_id, idempotency_key):
+        bucket = self.collection.find_one({"couple_id": couple_id, "moods.idempotency_key": idempotency_key},
+                                          {"user_id": 1, "moods": {"$elemMatch": {"idempotency_key": idempotency_key}}})
+        if bucket is None or not bucket.get('moods'):
+            return None
+        return dict(bucket['moods'][0], couple_id=couple_id, user_id=bucket['user_id'])
+
+    def remove(self, mood_ids):
+        # Satu $pull per bucket untuk semua mood yang dihapus darinya (index moods._id dari migrasi 10)
+        mood_ids = set(mood_ids)
+        removed = 0
+        for bucket in self.collection.find({"moods._id": {"$in": list(mood_ids)}}, {"moods._id": 1}):
+            ids = [mood['_id'] for mood in bucket['moods'] if mood['_id'] in mood_ids]
+            # Hanya jika semua mood itu masih ada, supaya count tetap sama dengan isi bucket
+            result = self.collection.update_one({"_id": bucket['_id'], "moods._id": {"$all": ids}},
+                                                {"$pull": {"moods": {"_id": {"$in": ids}}}, "$inc": {"count": -len(ids)}})
+            removed += len(ids) * result.modified_count
+        return removed
+
+    def _insert_many(self, moods):
+        for mood in moods:
+            mood.setdefault("_id", ObjectId())
+        chunks = list(bucket_chunks(moods))
+        if not chunks:
+            return []
+        failed = self._write_chunks(chunks)
+        return [mood for i, chunk in enumerate(chunks) if i not in failed for mood in chunk]
+
+    def _write_chunks(self, chunks):
+        """Append every chunk to its bucket in one unordered bulk write; returns the failed indexes"""
+        requests = [UpdateOne(*bucket_update(chunk[0]['couple_id'], chunk[0]['user_id'], chunk), upsert=True)
+                    for chunk in chunks]
+        try:
+            self.collection.bulk_write(requests, ordered=False)
+            return set()
+        except BulkWriteError as e:
+            return {error["index"] for error in e.details.get("writeErrors", ())}
+
+    def _buckets(self, query, sort):
+        return self.collection.find(query, {"month": 0, "count": 0}).sort(sort)
+
+    def _moods(self, query):
+        for bucket in self.collection.find(query, {"user_id": 1, "moods.mood_emoji": 1, "moods.created_at": 1}):
+            for mood in bucket.get('moods', ()):
+                yield dict(mood, user_id=bucket['user_id'])
+
+    def _range_stages(self, query, start_date, end_date):
+        range_start, range_end = local_date_range(start_date, end_date)
+        return [
+            # Bucket yang rentang waktunya beririsan dengan rentang grafik
+            {"$match": dict(query, first_created_at={"$lt": range_end}, last_created_at={"$gte": range_start})},
+            {"$unwind": "$moods"},
+            {"$project": {"user_id": 1, "mood_emoji": "$moods.mood_emoji", "created_at": "$moods.created_at"}},
+            {"$match": {"created_at": {"$gte": range_start, "$lt": range_end}}},
+        ]
+
+    def iter_couple(self, couple_id, batch_size=1000):
+        buckets = self._buckets({"couple_id": couple_id}, [("user_id", 1), ("last_created_at", -1)]).batch_size(batch_size)
+        for _, user_buckets in groupby(buckets, key=lambda bucket: bucket['user_id']):
+            yield from merge_bucket_moods(user_buckets)
+
+    def iter_by_user(self, batch_size=1000, projection=None):
+        # Mood di dalam bucket selalu dibaca lengkap, projection diabaikan
+        buckets = (self._buckets({}, [("couple_id", -1), ("user_id", -1), ("first_created_at", 1)])
+                   .batch_size(batch_size))
+        for _, user_buckets in groupby(buckets, key=lambda bucket: (bucket['couple_id'], bucket['user_id'])):
+            yield from merge_bucket_moods(user_buckets, newest_first=False)
+
+    def count(self, couple_id, user_id):
+        return sum(bucket['count'] for bucket in
+                   self.collection.find({"couple_id": couple_id, "user_id": user_id}, {"_id": 0, "count": 1}))
+
+    def page(self, couple_id, user_id, after=None, limit=5):
+        query = {"couple_id": couple_id, "user_id": user_id}
+        if after:
+            after = tuple(after)
+            query["first_created_at"] = {"$lte": after[0]}
+
+        # Bucket dibaca dari yang terbaru dan berhenti begitu halaman penuh
+        docs = []
+        for mood in merge_bucket_moods(self._buckets(query, [("last_created_at", -1)])):
+            if after and (mood['created_at'], mood['_id']) >= after:
+                continue
+            docs.append(mood)
+            if len(docs) > limit:
+                break
+
+        next_cursor = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_cursor = (docs[-1]['created_at'], docs[-1]['_id'])
+        return Mood.from_docs(docs), next_cursor
+
+    def search(self, couple_id, user_id, query, page=0, page_size=10):
+        # $text pada bucket hanya bisa menilai bucket, bukan mood, jadi selalu pakai index lokal
+        scope = {"couple_id": couple_id, "user_id": user_id}
+        return as_records(Mood, search.search(
+            self.collection, scope, query, page, page_size, use_text_index=False,
+            documents=lambda projection: merge_bucket_moods(self._buckets(scope, [("last_created_at", -1)]))))
+
+
+class QuotesRepo:
+    """Quote collection per couple (stored in the `replies` collection)"""
+
+    use_text_index = True
+
+    def __init__(self, db):
+        self.collection = db.replies
+        self.daily = db[DAILY_QUOTE_COLLECTION]
+
+    def add(self, quote):
+        """Insert a quote; returns False when its idempotency_key was already saved"""
+        quote.setdefault("rand", random.random())
+        if not insert_idempotent(self.collection.insert_one, quote):
+            return False
+        search.notify_insert("replies", {"couple_id": quote['couple_id']}, quote)
+        return True
+
+    def add_many(self, quotes):
+        """Insert a batch of quotes (unordered) and return the ones that were written"""
+        for quote in quotes:
+            quote.setdefault("rand", random.random())
+        inserted = insert_unordered(self.collection, quotes)
+        for quote in inserted:
+            search.notify_insert("replies", {"couple_id": quote['couple_id']}, quote)
+        return inserted
+
+    def iter_couple(self, couple_id, batch_size=1000):
+        """Stream every quote of a couple in index order (newest first)"""
+        return (self.collection.find({"couple_id": couple_id}, QUOTE_EXPORT_FIELDS)
+                .sort([("created_at", -1), ("_id", -1)])
+                .batch_size(batch_size))
+
+    def page(self, couple_id, after=None, limit=10):
+        return as_records(Quote, keyset_page(self.collection, {"couple_id": couple_id}, QUOTE_LIST_FIELDS,
+                                             after=after, limit=limit))
+
+    def search(self, couple_id, query, page=0, page_size=10):
+        return as_records(Quote, search.search(self.collection, {"couple_id": couple_id}, query, page, page_size,
+                                               use_text_index=self.use_text_index))
+
+    def sample(self, couple_id):
+        """Return one random quote for the couple, or None
+
+        Every quote carries a random `rand`; the first quote at or after a random point on
+        the (couple_id, rand) index is read, wrapping around to the smallest. Only quotes
+        the backfill has not reached yet lack `rand`, and while the couple has none with
+        it the quote is picked with $sample.
+        """
+        point = random.random()
+        for rand_filter in ({"$gte": point}, {"$lt": point}):
+            quote = self.collection.find_one({"couple_id": couple_id, "rand": rand_filter}, QUOTE_CARD_FIELDS,
+                                             sort=[("rand", 1)])
+            if quote is not None:
+                return quote
+        return self._sample_unindexed(couple_id)
+
+    def _sample_unindexed(self, couple_id):
+        pipeline = [
+            {"$match": {"couple_id": couple_id}},
+            {"$sample": {"size": 1}},
+            {"$project": QUOTE_CARD_FIELDS},
+        ]
+        return next(self.collection.aggregate(pipeline), None)
+
+    def quote_of_the_day(self, couple_id, day):
+        """The couple's quote for `day`, picked once and stored so every worker shows the same one
+
+        Quotes added later that day do not change the pick.
+        """
+        day = str(day)
+        stored = self.daily.find_one({"_id": couple_id, "day": day})
+        if stored is not None:
+            return stored['quote']
+
+        quote_filter = {"couple_id": couple_id}
+        total = self.collection.count_documents(quote_filter)
+        if not total:
+            return None
+        # Posisi dari hash (couple_id, hari), lalu disimpan; jumlah quote yang berubah tidak memindahkannya lagi
+        position = zlib.crc32(f"{couple_id}:{day}".encode()) % total
+        cursor = (self.collection.find(quote_filter, QUOTE_CARD_FIELDS)
+                  .sort([("created_at", 1), ("_id", 1)])
+                  .skip(position)
+                  .limit(1))
+        quote = next(cursor, None)
+        if quote is None:
+            return None
+        try:
+            # Hanya menimpa pilihan hari sebelumnya; worker lain yang lebih dulu menyimpan hari ini menang
+            self.daily.update_one({"_id": couple_id, "day": {"$ne": day}},
+                                  {"$set": {"day": day, "quote": quote}}, upsert=True)
+        except DuplicateKeyError:
+            pass
+        return self.daily.find_one({"_id": couple_id})['quote']
+
+
+class MemoryMoodsRepo(MoodsRepo):
+    """MoodsRepo for the in-memory backend, which lacks $text and the date operators"""
+
+    use_text_index = False
+
+    def _period_scores(self, query, unit, start_date, end_date):
+        """{(user_id, period): [scores]} for moods matching `query` within the date range"""
+        range_start, range_end = local_date_range(start_date, end_date)
+        buckets = defaultdict(list)
+        for mood in self._moods(query):
+            created_at = parse_timestamp(mood['created_at'])
+            if range_start <= created_at < range_end:
+                day = period_start(created_at.astimezone().date(), unit)
+                buckets[(mood['user_id'], day)].append(MOOD_SCORES.get(mood['mood_emoji']))
+        return buckets
+
+    @staticmethod
+    def _period_row(day, scores):
+        known = [s for s in scores if s is not None]
+        return {
+            "period": datetime.combine(day, time.min),
+            "score": round(sum(known) / len(known), 2) if known else None,
+            "count": len(scores),
+        }
+
+    def timeseries(self, couple_id, user_id, unit, start_date, end_date):
+        buckets = self._period_scores({"couple_id": couple_id, "user_id": user_id}, unit, start_date, end_date)
+        return [self._period_row(day, buckets[(user_id, day)]) for _, day in sorted(buckets)]
+
+    def couple_timeline(self, couple_id, unit, start_date, end_date):
+        buckets = self._period_scores({"couple_id": couple_id}, unit, start_date, end_date)
+        series = [dict(self._period_row(day, scores), user_id=user_id)
+                  for (user_id, day), scores in sorted(buckets.items(), key=lambda item: (item[0][1], item[0][0]))]
+
+        by_period = defaultdict(list)
+        for row in series:
+            if row["score"] is not None:
+                by_period[row["period"]].append(row["score"])
+        diffs = [abs(scores[0] - scores[1]) for scores in by_period.values() if len(scores) > 1]
+        if not diffs:
+            return series, EMPTY_AGREEMENT
+        return series, {
+            "shared_periods": len(diffs),
+            "mean_abs_diff": round(sum(diffs) / len(diffs), 2),
+            "agreement_rate": round(sum(1 for d in diffs if d <= 1) / len(diffs), 2),
+            "max_diff": round(max(diffs), 2),
+        }
+
+
+class MemoryBucketMoodsRepo(BucketMoodsRepo, MemoryMoodsRepo):
+    """BucketMoodsRepo for the in-memory backend; charts are bucketed in Python"""
+
+    def _insert_one(self, mood):
+        mood.setdefault("_id", ObjectId())
+        self._check_keys([mood])
+        super()._insert_one(mood)
+
+    def _write_chunks(self, chunks):
+        # bulk_write mongomock tidak menerima UpdateOne dari pymongo 4.x
+        failed = set()
+        for i, chunk in enumerate(chunks):
+            try:
+                self._check_keys(chunk)
+            except DuplicateKeyError:
+                failed.add(i)
+                continue
+            self.collection.update_one(*bucket_update(chunk[0]['couple_id'], chunk[0]['user_id'], chunk), upsert=True)
+        return failed
+
+    def _check_keys(self, moods):
+        # mongomock tidak menegakkan unique index multikey antar dokumen
+        keys = [mood_key(mood) for mood in moods]
+        if self.collection.find_one({"couple_id": moods[0]['couple_id'], "moods.idempotency_key": {"$in": keys}}, {"_id": 1}):
+            raise DuplicateKeyError("E11000 duplicate key error: moods.idempotency_key")
+
+
+class MemoryQuotesRepo(QuotesRepo):
+    """QuotesRepo for the in-memory backend, which lacks $text and $sample"""
+
+    use_text_index = False
+
+    def _sample_unindexed(self, couple_id):
+        total = self.collection.count_documents({"couple_id": couple_id})
+        if not total:
+            return None
+        cursor = self.collection.find({"couple_id": couple_id}, QUOTE_CARD_FIELDS).skip(random.randrange(total)).limit(1)
+        return next(cursor, None)
+
+
+class Repositories:
+    """The three repos for one database handle"""
+
+    def __init__(self, couples, moods, quotes, mood_stats):
+        self.couples = couples
+        self.moods = moods
+        self.quotes = quotes
+        self.mood_stats = mood_stats
+
+
+def create_repositories(db, backend="mongodb", mood_storage="flat"):
+    """Build the repos for `db`
+
+    Backend "memory" swaps in the stand-in implementations; mood_storage "bucket" stores
+    moods in monthly buckets (see BucketMoodsRepo).
+    """
+    couples = CouplesRepo(db)
+    mood_stats = MoodStatsRepo(db)
+    if backend == "memory":
+        moods_class = MemoryBucketMoodsRepo if mood_storage == "bucket" else MemoryMoodsRepo
+        return Repositories(couples, moods_class(db, couples, mood_stats), MemoryQuotesRepo(db), mood_stats)
+    moods_class = BucketMoodsRepo if mood_storage == "bucket" else MoodsRepo
+    return Repositories(couples, moods_class(db, couples, mood_stats), QuotesRepo(db), mood_stats)
@@ -0,0 +1,148 @@
+# search.py - pencarian teks untuk quote dan catatan mood
+
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from pymongo.errors import OperationFailure
+
+# Field yang dicari per koleksi, beserta bobotnya (sama dengan bobot text index di migrations.py)
+SEARCH_FIELDS = {
+    "replies": {"quote_text": 3, "author": 1},
+    "moods": {"mood_note": 1},
+    "mood_buckets": {"mood_note": 1},
+}
+
+# Field yang dikembalikan bersama hasil pencarian
+RESULT_FIELDS = {
+    "replies": ("quote_text", "author", "added_by", "created_at"),
+    "moods": ("mood_emoji", "mood_note", "created_at"),
+    "mood_buckets": ("mood_emoji", "mood_note", "created_at"),
+}
+
+# Index lokal dibangun ulang setelah umur ini (detik) supaya tulisan dari proses lain ikut
+LOCAL_INDEX_TTL = 600
+LOCAL_INDEX_MAX_SCOPES = 200
+
+# Kode error MongoDB saat $text dipakai tanpa text index
+INDEX_NOT_FOUND = 27
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+class LocalSearchIndex:
+    """In-memory inverted index over one couple's (or one user's) documents, ranked by TF-IDF"""
+
+    def __init__(self, collection_name):
+        self.fields = SEARCH_FIELDS[collection_name]
+        self.result_fields = RESULT_FIELDS[collection_name]
+        self.built_at = time.monotonic()
+        self._postings = {}
+        self._docs = {}
+        self._lock = threading.Lock()
+
+    def add(self, doc):
+        weighted = Counter()
+        for field, weight in self.fields.items():
+            for token in tokenize(doc.get(field)):
+                weighted[token] += weight
+
+        with self._lock:
+            self._docs[doc["_id"]] = {k: doc.get(k) for k in ("_id",) + self.result_fields}
+            for token, count in weighted.items():
+                self._postings.setdefault(token, {})[doc["_id"]] = count
+
+    def search(self, query, skip, limit):
+        tokens = set(tokenize(query))
+        scores = Counter()
+
+        with self._lock:
+            total = len(self._docs)
+            for token in tokens:
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + total / len(postings))
+                for doc_id, count in postings.items():
+                    scores[doc_id] += (1 + math.log(count)) * idf
+
+            # Skor sama: dokumen terbaru (ObjectId lebih besar) dulu
+            ranked = sorted(scores.items(), key=lambda item: (item[1], str(item[0])), reverse=True)[skip:skip + limit]
+            return [dict(self._docs[doc_id], score=round(score, 3)) for doc_id, score in ranked]
+
+
+_lock = threading.Lock()
+_local_indexes = OrderedDict()
+# Koleksi yang ternyata tidak punya text index (mis. backend in-memory)
+_text_unavailable = set()
+
+
+def _local_index(collection, scope, documents=None):
+    key = (collection.name,) + tuple(sorted(scope.items()))
+    with _lock:
+        index = _local_indexes.get(key)
+        if index is not None and time.monotonic() - index.built_at < LOCAL_INDEX_TTL:
+            _local_indexes.move_to_end(key)
+            return index
+
+    index = LocalSearchIndex(collection.name)
+    projection = {field: 1 for field in index.fields}
+    projection.update({field: 1 for field in index.result_fields})
+    docs = documents(projection) if documents else collection.find(scope, projection).batch_size(1000)
+    for doc in docs:
+        index.add(doc)
+
+    with _lock:
+        _local_indexes[key] = index
+        while len(_local_indexes) > LOCAL_INDEX_MAX_SCOPES:
+            _local_indexes.popitem(last=False)
+    return index
+
+
+def notify_insert(collection_name, scope, doc):
+    """Add a freshly inserted document to the local index for its scope, if one is loaded"""
+    key = (collection_name,) + tuple(sorted(scope.items()))
+    with _lock:
+        index = _local_indexes.get(key)
+    if index is not None:
+        index.add(doc)
+
+
+def search(collection, scope, query, page=0, page_size=10, use_text_index=True, documents=None):
+    """Ranked search inside `scope` (e.g. {"couple_id": ...}); returns (results, has_more)
+
+    Uses the MongoDB text index when it exists and falls back to a local inverted index
+    for deployments without one (or when use_text_index is False). `documents(projection)`
+    replaces collection.find(scope, projection) as the source of the local index, for
+    collections that nest the searchable documents (mood buckets).
+    """
+    if not query or not query.strip():
+        return [], False
+
+    skip = page * page_size
+    if use_text_index and collection.name not in _text_unavailable:
+        try:
+            projection = {field: 1 for field in RESULT_FIELDS[collection.name]}
+            projection["score"] = {"$meta": "textScore"}
+            cursor = (collection.find(dict(scope, **{"$text": {"$search": query}}), projection)
+                      .sort([("score", {"$meta": "textScore"})])
+                      .skip(skip)
+                      .limit(page_size + 1))
+            results = list(cursor)
+            return results[:page_size], len(results) > page_size
+        except OperationFailure as e:
+            if e.code != INDEX_NOT_FOUND:
+                raise
+            _text_unavailable.add(collection.name)
+        except NotImplementedError:
+            # Backend pengganti (mis. mongomock) tidak mendukung $text
+            _text_unavailable.add(collection.name)
+
+    results = _local_index(collection, scope, documents).search(query, skip, page_size + 1)
+    return results[:page_size], len(results) > page_size
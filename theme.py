@@ -0,0 +1,260 @@
+# theme.py - stylesheet tema terang/gelap sebagai file statis ber-hash dan font Quicksand yang di-host sendiri
+
+import argparse
+import glob
+import hashlib
+import os
+import threading
+import urllib.request
+
+# Disajikan Streamlit di /app/static/ jika [server] enableStaticServing = true
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL = "app/static"
+STYLESHEET_PREFIX = "ceritakita"
+
+# Font Quicksand (SIL Open Font License) bisa disimpan di static/fonts lewat `theme.py fetch-font`;
+# @font-face hanya ditulis ke stylesheet jika file itu ada
+FONT_FILE = "fonts/Quicksand-wght.ttf"
+FONT_SOURCES = {
+    FONT_FILE: "https://github.com/google/fonts/raw/main/ofl/quicksand/Quicksand%5Bwght%5D.ttf",
+    "fonts/OFL.txt": "https://github.com/google/fonts/raw/main/ofl/quicksand/OFL.txt",
+}
+
+# Opsional lewat [theme] google_fonts = true, untuk deployment yang tidak meng-host font sendiri
+GOOGLE_FONTS_HTML = ('<link rel="stylesheet" '
+                     'href="https://fonts.googleapis.com/css2?family=Quicksand:wght@400;500;600;700&display=swap">')
+google_fonts = False
+
+# Class elemen penanda di halaman; stylesheet memakai palet gelap selama elemen ini ada
+DARK_MARKER_CLASS = "ceritakita-theme-dark"
+
+THEMES = {
+    "light": {
+        "bg-color": "#F8F0FC",
+        "text-color": "#333333",
+        "card-bg-color": "white",
+        "card-shadow": "0 4px 6px rgba(0, 0, 0, 0.05)",
+        "quote-bg": "#EBDFFC",
+    },
+    "dark": {
+        "bg-color": "#121212",
+        "text-color": "#F0F0F0",
+        "card-bg-color": "#1E1E1E",
+        "card-shadow": "0 4px 6px rgba(0, 0, 0, 0.2)",
+        "quote-bg": "#2D2D2D",
+    },
+}
+
+FONT_FACE = """@font-face {
+    font-family: 'Quicksand';
+    font-style: normal;
+    font-weight: 300 700;
+    font-display: swap;
+    src: local('Quicksand'), url('%s') format('truetype');
+}
+""" % FONT_FILE
+
+BASE_CSS = """:root {
+    --primary-color: #BFA2DB;
+    --accent-color: #9A73C7;
+}
+
+.stApp {
+    background-color: var(--bg-color);
+    color: var(--text-color);
+    font-family: 'Quicksand', sans-serif;
+}
+
+.main-header {
+    color: var(--primary-color);
+    font-size: 2.5rem;
+    font-weight: 700;
+    text-align: center;
+    margin-bottom: 1rem;
+}
+
+.sub-header {
+    color: var(--accent-color);
+    font-size: 1.5rem;
+    font-weight: 600;
+    margin-top: 2rem;
+}
+
+.card {
+    background-color: var(--card-bg-color);
+    border-radius: 15px;
+    padding: 1.5rem;
+    box-shadow: var(--card-shadow);
+    margin: 1rem 0;
+}
+
+.mood-emoji {
+    font-size: 2rem;
+}
+
+.stButton > button {
+    background-color: var(--primary-color);
+    color: white;
+    border-radius: 20px;
+    border: none;
+    padding: 0.5rem 1.5rem;
+    font-weight: 500;
+}
+
+.stButton > button:hover {
+    background-color: var(--accent-color);
+}
+
+/* Login form submit button styling */
+.stButton button[kind="formSubmit"] {
+    background-color: var(--primary-color);
+    color: white;
+    width: 100%;
+    border-radius: 20px;
+    padding: 0.6rem 0;
+    margin-top: 1rem;
+    font-weight: 600;
+    font-size: 1.1rem;
+    transition: all 0.3s ease;
+}
+
+.stButton button[kind="formSubmit"]:hover {
+    background-color: var(--accent-color);
+    transform: translateY(-2px);
+}
+
+.quote-box {
+    background-color: var(--quote-bg);
+    border-radius: 10px;
+    padding: 1rem;
+    font-style: italic;
+    text-align: center;
+}
+
+div.stTextInput > div > div > input {
+    border-radius: 10px;
+    border: 1px solid var(--primary-color);
+}
+
+.sidebar-header {
+    text-align: center;
+    margin-bottom: 1.5rem;
+}
+
+.theme-toggle {
+    position: absolute;
+    top: 10px;
+    right: 10px;
+    z-index: 1000;
+}
+"""
+
+
+def palette(selector, theme_mode):
+    variables = "".join(f"    --{name}: {value};\n" for name, value in THEMES[theme_mode].items())
+    return f"{selector} {{\n{variables}}}\n"
+
+
+def font_hosted(static_dir=STATIC_DIR):
+    return os.path.exists(os.path.join(static_dir, FONT_FILE))
+
+
+def build_css(static_dir=STATIC_DIR):
+    """Both themes in one stylesheet; the dark palette applies while the marker element is on the page
+
+    The @font-face rule is only included when the font was fetched into `static_dir`.
+    """
+    parts = [FONT_FACE] if font_hosted(static_dir) else []
+    parts += [
+        palette(":root", "light"),
+        palette(f":root:has(.{DARK_MARKER_CLASS})", "dark"),
+        BASE_CSS,
+    ]
+    return "\n".join(parts)
+
+
+def stylesheet_name(css):
+    """Content-hashed file name, so browsers can cache it and a changed theme gets a new URL"""
+    return f"{STYLESHEET_PREFIX}.{hashlib.sha256(css.encode()).hexdigest()[:12]}.css"
+
+
+def publish(static_dir=STATIC_DIR):
+    """Write the stylesheet to `static_dir` if it is not there yet and return its file name
+
+    Stylesheets of older builds are removed.
+    """
+    css = build_css(static_dir)
+    name = stylesheet_name(css)
+    path = os.path.join(static_dir, name)
+    if not os.path.exists(path):
+        os.makedirs(static_dir, exist_ok=True)
+        # Tulis ke file sementara dulu supaya worker lain tidak menyajikan file setengah jadi
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8", newline="\n") as f:
+            f.write(css)
+        os.replace(temp_path, path)
+    for old_path in glob.glob(os.path.join(static_dir, f"{STYLESHEET_PREFIX}.*.css")):
+        if os.path.basename(old_path) != name:
+            os.remove(old_path)
+    return name
+
+
+_lock = threading.Lock()
+_stylesheet_html = None
+
+
+def stylesheet_html():
+    """<link> to the published stylesheet, built once per process
+
+    If the static directory is not writable, the stylesheet is inlined instead.
+    """
+    global _stylesheet_html
+
+    with _lock:
+        if _stylesheet_html is None:
+            try:
+                _stylesheet_html = f'<link rel="stylesheet" href="{STATIC_URL}/{publish()}">'
+            except OSError:
+                _stylesheet_html = f"<style>\n{build_css()}</style>"
+        return _stylesheet_html
+
+
+def theme_html(theme_mode):
+    """Markup sent on every rerun: the stylesheet link plus, in dark mode, the marker element"""
+    marker = f"<span class='{DARK_MARKER_CLASS}'></span>" if theme_mode == "dark" else ""
+    fonts = GOOGLE_FONTS_HTML if google_fonts else ""
+    return fonts + stylesheet_html() + marker
+
+
+def configure_from_secrets(theme_secrets):
+    """Apply the optional [theme] secrets section: google_fonts"""
+    global google_fonts
+    google_fonts = bool(theme_secrets.get("google_fonts", False))
+
+
+def fetch_font(static_dir=STATIC_DIR):
+    """Download Quicksand and its license into static/fonts (once, when deploying)"""
+    for relative_path, url in FONT_SOURCES.items():
+        path = os.path.join(static_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with urllib.request.urlopen(url, timeout=30) as response, open(path, "wb") as f:
+            f.write(response.read())
+        print(f"{relative_path}: {os.path.getsize(path) // 1024} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bangun stylesheet tema CeritaKita dan unduh font")
+    parser.add_argument("command", choices=["build", "fetch-font"])
+    args = parser.parse_args()
+
+    if args.command == "build":
+        name = publish()
+        print(f"{STATIC_URL}/{name} ({os.path.getsize(os.path.join(STATIC_DIR, name))} byte)")
+    else:
+        fetch_font()
+        # Stylesheet baru dengan @font-face untuk font yang baru diunduh
+        print(f"{STATIC_URL}/{publish()}")
+
+
+if __name__ == "__main__":
+    main()
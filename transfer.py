@@ -0,0 +1,234 @@
+# transfer.py - ekspor dan impor massal mood dan quote (CSV / JSON lines) dengan memori terbatas
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+import database
+import repository
+from repository import MOOD_SCORES, UNKNOWN_AUTHOR, parse_timestamp
+
+FORMATS = ("csv", "jsonl")
+DEFAULT_BATCH_SIZE = 1000
+
+# Kolom per jenis data, dalam urutan kolom CSV
+EXPORT_COLUMNS = {
+    "moods": ("user_id", "mood_emoji", "mood_note", "created_at"),
+    "quotes": ("quote_text", "author", "added_by", "created_at"),
+}
+
+MAX_TEXT_LENGTH = 5000
+# Contoh baris yang gagal validasi yang disimpan untuk laporan
+MAX_REPORTED_ERRORS = 20
+
+
+class ImportResult:
+    """Running totals of one import"""
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.skipped = 0
+        self.errors = []
+
+    def reject(self, line, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"baris {line}: {message}")
+
+
+def format_from_filename(filename):
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    return "jsonl" if extension in ("jsonl", "ndjson", "json") else "csv"
+
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return parse_timestamp(value).astimezone(timezone.utc).isoformat()
+    return value if value is not None else ""
+
+
+def export_lines(repo, couple_id, kind, fmt="csv", batch_size=DEFAULT_BATCH_SIZE):
+    """Yield the couple's moods or quotes as CSV or JSON-lines text, one line at a time
+
+    The cursor is read in batches of `batch_size`, so memory use does not grow with the
+    size of the collection.
+    """
+    columns = EXPORT_COLUMNS[kind]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if fmt == "csv":
+        writer.writerow(columns)
+        yield buffer.getvalue()
+
+    for doc in repo.iter_couple(couple_id, batch_size=batch_size):
+        row = [_export_value(doc.get(column)) for column in columns]
+        if fmt == "csv":
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            yield buffer.getvalue()
+        else:
+            yield json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n"
+
+
+def read_rows(text_stream, fmt):
+    """Yield (row, error) pairs from a CSV or JSON-lines text stream; error is None for valid rows"""
+    if fmt == "csv":
+        for row in csv.DictReader(text_stream):
+            yield row, None
+        return
+
+    for line in text_stream:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield None, f"JSON tidak valid ({e})"
+            continue
+        if not isinstance(row, dict):
+            yield None, "baris JSON harus berupa object"
+            continue
+        yield row, None
+
+
+def _text(row, field, required=False, default=""):
+    value = row.get(field)
+    value = default if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"{field} wajib diisi")
+    if len(value) > MAX_TEXT_LENGTH:
+        raise ValueError(f"{field} lebih dari {MAX_TEXT_LENGTH} karakter")
+    return value
+
+
+def _timestamp(row, now):
+    value = row.get("created_at")
+    if not value:
+        return now
+    try:
+        return parse_timestamp(str(value).strip()).astimezone(timezone.utc)
+    except ValueError:
+        raise ValueError(f"created_at bukan tanggal ISO: {value!r}")
+
+
+def validate_mood(row, couple_id, now):
+    user_id = _text(row, "user_id", required=True)
+    if user_id not in ("person1", "person2"):
+        raise ValueError("user_id harus person1 atau person2")
+    mood_emoji = _text(row, "mood_emoji", required=True)
+    if mood_emoji not in MOOD_SCORES:
+        raise ValueError(f"mood_emoji tidak dikenal: {mood_emoji}")
+    return {
+        "couple_id": couple_id,
+        "user_id": user_id,
+        "mood_emoji": mood_emoji,
+        "mood_note": _text(row, "mood_note"),
+        "created_at": _timestamp(row, now),
+    }
+
+
+def validate_quote(row, couple_id, now, added_by):
+    quote_added_by = _text(row, "added_by", default=added_by) or added_by
+    if quote_added_by not in ("person1", "person2"):
+        raise ValueError("added_by harus person1 atau person2")
+    return {
+        "couple_id": couple_id,
+        "quote_text": _text(row, "quote_text", required=True),
+        "author": _text(row, "author", default=UNKNOWN_AUTHOR) or UNKNOWN_AUTHOR,
+        "added_by": quote_added_by,
+        "created_at": _timestamp(row, now),
+    }
+
+
+def import_rows(repo, couple_id, kind, rows, added_by="", batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Validate rows from read_rows() and insert them in unordered batches
+
+    Only one batch is held in memory at a time. Rows always go to `couple_id`; invalid
+    rows are skipped and reported in the result. `progress(result)` is called after
+    every batch.
+    """
+    result = ImportResult()
+    now = datetime.now(timezone.utc)
+    batch = []
+
+    def flush():
+        result.inserted += len(repo.add_many(batch))
+        batch.clear()
+        if progress:
+            progress(result)
+
+    for row, error in rows:
+        result.rows += 1
+        if error:
+            result.reject(result.rows, error)
+            continue
+        try:
+            if kind == "moods":
+                batch.append(validate_mood(row, couple_id, now))
+            else:
+                batch.append(validate_quote(row, couple_id, now, added_by))
+        except ValueError as e:
+            result.reject(result.rows, str(e))
+            continue
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+    elif progress:
+        progress(result)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ekspor/impor mood dan quote CeritaKita")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("kind", choices=sorted(EXPORT_COLUMNS))
+    parser.add_argument("couple_code")
+    parser.add_argument("file", help="file tujuan (export, '-' untuk stdout) atau sumber (import)")
+    parser.add_argument("--format", choices=FORMATS, help="default dari ekstensi file")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--added-by", default="", choices=("person1", "person2"),
+                        help="added_by untuk quote yang tidak punya kolom itu")
+    args = parser.parse_args()
+
+    secrets = database.load_local_secrets()
+    mongo_secrets = secrets["mongodb"]
+    db = database.get_database(mongo_secrets["uri"], database.load_client_options(mongo_secrets))
+    repos = repository.create_repositories(db, mood_storage=repository.get_mood_storage(secrets.get("moods")))
+    repo = repos.moods if args.kind == "moods" else repos.quotes
+
+    couple = repos.couples.find_by_code(args.couple_code)
+    if couple is None:
+        sys.exit(f"couple code {args.couple_code} tidak ditemukan")
+    couple_id = couple.id
+    fmt = args.format or format_from_filename(args.file)
+
+    if args.command == "export":
+        out = sys.stdout if args.file == "-" else open(args.file, "w", newline="", encoding="utf-8")
+        try:
+            for line in export_lines(repo, couple_id, args.kind, fmt, args.batch_size):
+                out.write(line)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        return
+
+    with open(args.file, newline="", encoding="utf-8-sig") as f:
+        result = import_rows(
+            repo, couple_id, args.kind, read_rows(f, fmt), added_by=args.added_by, batch_size=args.batch_size,
+            progress=lambda r: print(f"{r.rows} baris dibaca, {r.inserted} disimpan, {r.skipped} dilewati"),
+        )
+    for error in result.errors:
+        print(error)
+
+
+if __name__ == "__main__":
+    main()